@@ -0,0 +1,282 @@
+"""
+Punto de entrada por línea de comandos.
+
+    python cli.py extract    --input input/PAES/ --output output/PAES/
+    python cli.py extract    --shard 0/4          (en cada nodo, i = 0..3)
+    python cli.py merge      --shards 4
+    python cli.py categorize --output output/PAES/ [--index bbdd_PAES_x.xlsx]
+    python cli.py explore    input/PAES/x.pdf --out PRUEBA.pdf
+    python cli.py bench      --input input/PAES/
+    python cli.py status
+    python cli.py watch
+
+Cada subcomando importa sólo los módulos pesados que necesita (fitz, pandas, openai...):
+'status' y '--help' no cargan ninguno.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_INPUT = "input/PAES/"
+DEFAULT_OUTPUT = "output/PAES/"
+# Índice completo de get_questions/merge (los índices por PDF del modo vigilancia no cuentan)
+INDEX_NAME = re.compile(r"bbdd_PAES_\d{8}_\d{6}\.xlsx")
+
+
+def _dir_arg(path: str) -> str:
+    """El pipeline arma rutas concatenando strings: asegurar '/' final."""
+    return path.rstrip("/\\") + "/"
+
+def _shard_arg(value: str) -> tuple[int, int]:
+    """'i/N' -> (i, N)."""
+    try:
+        i, n = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Formato esperado i/N (p.ej. 0/4), no {value!r}")
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"Se requiere 0 <= i < N, no {value!r}")
+    return i, n
+
+def _latest_index(output_path: str) -> str | None:
+    """Excel bbdd_PAES_<timestamp>.xlsx más reciente en output_path (el último get_questions)."""
+    candidates = sorted((p for p in Path(output_path).glob("bbdd_PAES_*.xlsx") if INDEX_NAME.fullmatch(p.name)),
+                        key=lambda p: p.stat().st_mtime)
+    return str(candidates[-1]) if candidates else None
+
+
+# -------------------- Subcomandos --------------------
+
+def cmd_extract(args):
+    if args.shard:
+        from core.sharding import run_shard
+
+        shard_index, num_shards = args.shard
+        df_shard = run_shard(args.input, args.output, shard_index, num_shards, mode=args.shard_mode,
+                             **_extraction_kwargs(args))
+        print(f"[OK] {len(df_shard)} preguntas extraídas en el shard {shard_index}/{num_shards}.")
+        return 0
+
+    from core.identificacion_preguntas_PAES import get_questions
+
+    df_questions = get_questions(args.input, args.output, pdf_files=args.files,
+                                 save_excel=not args.no_excel, **_extraction_kwargs(args))
+    print(f"[OK] {len(df_questions)} preguntas extraídas.")
+    return 0
+
+def cmd_merge(args):
+    from core.sharding import merge_shard_manifests
+
+    merge_shard_manifests(args.output, args.shards, save_excel=True)
+    return 0
+
+def cmd_categorize(args):
+    index_path = args.index or _latest_index(args.output)
+    if index_path is None:
+        print(f"[ERROR] No hay bbdd_PAES_*.xlsx en {args.output}; corre 'extract' o usa --index.")
+        return 1
+
+    import pandas as pd
+    from core.categorizacion_gpt import run_categorization
+
+    print(f"[INFO] Índice de preguntas: {index_path}")
+    df_questions = pd.read_excel(index_path)
+    if args.docs:
+        df_questions = df_questions[df_questions["pdf_file"].isin(args.docs)]
+    run_categorization(df_questions, args.output, overwrite=args.overwrite,
+                       model=args.model, batch_size=args.batch_size, budget=_budget(args))
+    return 0
+
+def cmd_explore(args):
+    from core.pdf_exploring import explore_pdf
+
+    out_pdf = args.out or f"PRUEBA_{Path(args.pdf).stem}.pdf"
+    left_ratio = None if args.full_page else args.left_ratio
+    explore_pdf(args.pdf, out_pdf, left_ratio=left_ratio, layers=tuple(args.layers))
+    print(f"[OK] Cajas dibujadas en {out_pdf}")
+    return 0
+
+def cmd_bench(args):
+    import tempfile
+
+    t0 = time.perf_counter()
+    from core.identificacion_preguntas_PAES import extract_pdf_questions, list_pdf_files
+    import_s = time.perf_counter() - t0
+    print(f"[BENCH] import extracción: {import_s * 1000:.0f} ms")
+
+    pdf_files = args.files or list_pdf_files(args.input)
+    total_s, total_q = 0.0, 0
+    with tempfile.TemporaryDirectory() as tmp_out:
+        for pdf_file in pdf_files:
+            best = None
+            n_questions = 0
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                df_doc = extract_pdf_questions(os.path.join(args.input, pdf_file), tmp_out + "/",
+                                               **_extraction_kwargs(args))
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+                n_questions = 0 if df_doc is None else len(df_doc)
+            total_s += best or 0.0
+            total_q += n_questions
+            per_q = (best / n_questions * 1000) if n_questions else 0.0
+            print(f"[BENCH] {pdf_file}: {n_questions} preguntas, {best:.2f} s ({per_q:.0f} ms/pregunta)")
+    print(f"[BENCH] Total: {total_q} preguntas en {total_s:.2f} s")
+    return 0
+
+def cmd_status(args):
+    from core.watch_mode import STATE_FILE, load_state, scan_pdfs, output_dir_for
+
+    input_root, output_root = Path(args.input_root), Path(args.output_root)
+    state = load_state(output_root / STATE_FILE)["files"]
+    pdfs = scan_pdfs(input_root) if input_root.exists() else {}
+
+    counts: dict[str, int] = {}
+    for pdf_path in sorted(set(pdfs) | set(state)):
+        entry = state.get(pdf_path, {})
+        status = entry.get("status", "new")
+        if pdf_path not in pdfs:
+            status = "missing"
+        elif entry and [entry.get("size"), entry.get("mtime_ns")] != list(pdfs[pdf_path]):
+            status = "modified"
+        out_dir = output_dir_for(Path(pdf_path), input_root, output_root)
+        categorized = Path(out_dir + f"dict_PAES_{Path(pdf_path).stem}.json").exists()
+        counts[status] = counts.get(status, 0) + 1
+        if args.json:
+            continue
+        detail = f" ({entry['questions']} preguntas)" if entry.get("questions") is not None else ""
+        error = f" error: {entry['error']}" if entry.get("error") else ""
+        flag = "categorizado" if categorized else "sin categorizar"
+        print(f"{status:>9}  {flag:<15}  {pdf_path}{detail}{error}")
+
+    if args.json:
+        print(json.dumps(counts, ensure_ascii=False, sort_keys=True))
+    else:
+        print("Resumen: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    return 0
+
+def cmd_watch(args):
+    from core.watch_mode import watch
+
+    watch(args.input_root, args.output_root,
+          poll_seconds=args.poll_seconds, max_workers=args.workers,
+          categorize=not args.no_categorize, once=args.once,
+          extract_kwargs=_extraction_kwargs(args), budget=_budget(args))
+    return 0
+
+
+# -------------------- Parser --------------------
+
+def _add_extraction_args(p):
+    p.add_argument("--padding-cm", type=float, default=-0.25, help="Margen vertical del recorte (cm).")
+    p.add_argument("--left-ratio", type=float, default=0.143, help="Ancho de la franja izquierda con los números.")
+    p.add_argument("--tight-crop", action="store_true", help="Recortar cada pregunta a la caja de su contenido.")
+    p.add_argument("--footer-cm", type=float, default=1.5,
+                   help="(tight-crop) Banda inferior ignorada, además de los encabezados/pies repetidos.")
+    p.add_argument("--max-pixels", type=int,
+                   help="Máximo de píxeles por imagen, PNG y JPG enviado al modelo (baja la resolución si se supera).")
+    p.add_argument("--engine", choices=["legacy", "vector"], default="legacy",
+                   help="Detección de límites: 'vector' usa el índice NumPy con columnas y continuaciones.")
+    p.add_argument("--adaptive-strip", action="store_true",
+                   help="(vector) Franja de números ajustada a cada columna en vez de --left-ratio.")
+    p.add_argument("--max-full-regions", type=int, default=0,
+                   help="(vector) Columnas/páginas completas sin preguntas que puede abarcar una continuación.")
+
+def _extraction_kwargs(args) -> dict:
+    kwargs = {"padding_cm": args.padding_cm, "left_ratio": args.left_ratio,
+              "tight_crop": args.tight_crop, "footer_cm": args.footer_cm, "max_pixels": args.max_pixels}
+    if args.engine == "vector":
+        kwargs["engine"] = "vector"
+        kwargs["engine_kwargs"] = {"max_full_regions": args.max_full_regions}
+        if args.adaptive_strip:
+            kwargs["left_ratio"] = None
+    return kwargs
+
+def _add_budget_args(p, scope: str = "de la corrida"):
+    p.add_argument("--max-cost-usd", type=float, help=f"Tope de gasto estimado {scope}.")
+    p.add_argument("--max-tokens", type=int, help=f"Tope de tokens totales {scope}.")
+    p.add_argument("--on-exceed", choices=["stop", "downgrade"], default="stop",
+                   help="'downgrade' cambia a --downgrade-model al 80%% del tope antes de detenerse.")
+    p.add_argument("--downgrade-model", default="gpt-5-nano")
+
+def _budget(args):
+    from core.telemetry import Budget
+
+    return Budget(max_cost_usd=args.max_cost_usd, max_total_tokens=args.max_tokens,
+                  on_exceed=args.on_exceed, downgrade_model=args.downgrade_model)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Extracción y categorización de preguntas PAES/PSU.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("extract", help="Recorta las preguntas de los PDFs y genera el Excel índice.")
+    p.add_argument("--input", type=_dir_arg, default=DEFAULT_INPUT)
+    p.add_argument("--output", type=_dir_arg, default=DEFAULT_OUTPUT)
+    p.add_argument("--files", nargs="+", help="Procesar sólo estos PDFs (nombres dentro de --input).")
+    p.add_argument("--no-excel", action="store_true", help="No guardar bbdd_PAES_<timestamp>.xlsx.")
+    p.add_argument("--shard", type=_shard_arg, help="Procesar sólo el shard i de N (i/N) y escribir su manifest.")
+    p.add_argument("--shard-mode", choices=["hash", "round_robin"], default="hash")
+    _add_extraction_args(p)
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser("merge", help="Une los manifests de 'extract --shard' en un único Excel índice.")
+    p.add_argument("--output", type=_dir_arg, default=DEFAULT_OUTPUT)
+    p.add_argument("--shards", type=int, required=True, help="Número total de shards (N).")
+    p.set_defaults(func=cmd_merge)
+
+    p = sub.add_parser("categorize", help="Categoriza con OpenAI las preguntas de un Excel índice.")
+    p.add_argument("--output", type=_dir_arg, default=DEFAULT_OUTPUT)
+    p.add_argument("--index", help="Excel de get_questions (por defecto, el más reciente en --output).")
+    p.add_argument("--docs", nargs="+", help="Categorizar sólo estos pdf_file.")
+    p.add_argument("--overwrite", action="store_true", help="Recalcular todas las etapas aunque estén al día.")
+    p.add_argument("--model", help="Modelo para todas las etapas (por defecto, el de cada etapa).")
+    p.add_argument("--batch-size", type=int, default=8, help="Preguntas (imágenes) por request.")
+    _add_budget_args(p)
+    p.set_defaults(func=cmd_categorize)
+
+    p = sub.add_parser("explore", help="Dibuja las cajas de texto/imágenes de un PDF para calibrar recortes.")
+    p.add_argument("pdf")
+    p.add_argument("--out", help="PDF de salida (por defecto PRUEBA_<nombre>.pdf).")
+    p.add_argument("--left-ratio", type=float, default=0.143)
+    p.add_argument("--full-page", action="store_true", help="Dibujar la página completa, no sólo la franja.")
+    p.add_argument("--layers", nargs="+", default=["words"],
+                   choices=["blocks", "lines", "spans", "words", "images", "drawings", "links"])
+    p.set_defaults(func=cmd_explore)
+
+    p = sub.add_parser("bench", help="Mide el tiempo de extracción por PDF (salida a un directorio temporal).")
+    p.add_argument("--input", type=_dir_arg, default=DEFAULT_INPUT)
+    p.add_argument("--files", nargs="+")
+    p.add_argument("--repeat", type=int, default=1, help="Repeticiones por PDF (se reporta la mejor).")
+    _add_extraction_args(p)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("status", help="Estado de los PDFs de input/ (watch_state.json y JSON categorizados).")
+    p.add_argument("--input-root", default="input/")
+    p.add_argument("--output-root", default="output/")
+    p.add_argument("--json", action="store_true", help="Sólo el resumen de conteos en JSON.")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("watch", help="Vigila input/ y procesa los PDFs nuevos o modificados.")
+    p.add_argument("--input-root", default="input/")
+    p.add_argument("--output-root", default="output/")
+    p.add_argument("--poll-seconds", type=float, default=10.0)
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--no-categorize", action="store_true", help="Sólo extraer.")
+    p.add_argument("--once", action="store_true", help="Procesar lo pendiente y salir.")
+    _add_extraction_args(p)
+    # Cada PDF se categoriza en su propio proceso trabajador, con su propio contador
+    _add_budget_args(p, scope="por PDF (cada trabajador lo aplica por separado)")
+    p.set_defaults(func=cmd_watch)
+
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
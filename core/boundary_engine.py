@@ -0,0 +1,451 @@
+"""
+Motor vectorizado de límites de preguntas.
+
+En vez de recorrer palabra por palabra, se arma un índice por documento con NumPy
+(posición de cada palabra, si es un token numérico de pregunta, página y columna) y los
+límites se calculan con operaciones sobre arreglos:
+
+1. build_page_index: una lectura de get_text("words") por página -> arreglos planos.
+2. detect_columns: cobertura horizontal de las palabras por página; un canal vacío en la
+   franja central separa dos columnas (documentos PSU a dos columnas).
+3. build_question_plan: candidatos (encabezados "PREGUNTA n" o tokens 'n', 'n.', 'n)' en
+   la franja izquierda de su columna), filtro de numeración consecutiva, y_top/y_bottom
+   por columna y continuación de la última pregunta de cada columna en la siguiente
+   columna/página.
+
+El resultado es un "plan" (DataFrame) que la etapa de exportación consume tal cual.
+"""
+from dataclasses import dataclass
+
+import fitz  # PyMuPDF
+import numpy as np
+import pandas as pd
+
+PT_PER_CM = 72 / 2.54
+MAX_COLUMNS = 2
+PLAN_COLUMNS = ["page", "question_number", "y_top", "y_bottom", "W", "H", "segments"]
+
+
+@dataclass
+class PageIndex:
+    """Índice compacto de un documento: una posición por palabra y una por página."""
+    page: np.ndarray         # int, página de cada palabra (0-based)
+    x0: np.ndarray
+    y0: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    text: np.ndarray         # str, texto de cada palabra
+    line_id: np.ndarray      # int, identificador único (página, bloque, línea)
+    line_start: np.ndarray   # bool, primera palabra de su línea (word_no == 0)
+    number: np.ndarray       # int, número del token 'n'/'n.'/'n)' o -1
+    page_w: np.ndarray       # ancho de cada página
+    page_h: np.ndarray       # alto de cada página
+
+    @property
+    def n_pages(self) -> int:
+        return len(self.page_w)
+
+
+# -------------------- 1) Índice --------------------
+
+def parse_question_tokens(texts: np.ndarray) -> np.ndarray:
+    """Versión vectorizada de QUESTION_TOKEN: 1 a 3 dígitos con a lo más un '.' o ')' final.
+    Devuelve el número o -1."""
+    number = np.full(len(texts), -1, dtype=np.int64)
+    if len(texts) == 0:
+        return number
+    stripped = np.char.strip(texts)
+    core = np.char.rstrip(stripped, ".)")
+    core_len = np.char.str_len(core)
+    valid = (
+        (np.char.str_len(stripped) - core_len <= 1)
+        & (core_len >= 1) & (core_len <= 3)
+        & np.char.isdecimal(core)
+    )
+    if valid.any():
+        number[valid] = core[valid].astype(np.int64)
+    return number
+
+def build_page_index(doc: fitz.Document) -> PageIndex:
+    """Lee las palabras de todas las páginas una sola vez y las deja en arreglos NumPy."""
+    n_pages = len(doc)
+    page_w = np.empty(n_pages)
+    page_h = np.empty(n_pages)
+    pages, x0s, y0s, x1s, y1s, texts, line_ids, word_nos = [], [], [], [], [], [], [], []
+
+    for page in doc:
+        page_w[page.number] = page.rect.width
+        page_h[page.number] = page.rect.height
+        try:
+            words = page.get_text("words")
+        except Exception as e:
+            print(f"[WARN] get_text fallo en p.{page.number}: {e}")
+            continue
+        if not words:
+            continue
+        x0, y0, x1, y1, text, block, line, word_no = zip(*words)
+        pages.append(np.full(len(words), page.number, dtype=np.int64))
+        x0s.append(np.asarray(x0, dtype=float)); y0s.append(np.asarray(y0, dtype=float))
+        x1s.append(np.asarray(x1, dtype=float)); y1s.append(np.asarray(y1, dtype=float))
+        texts.append(np.asarray(text, dtype=str))
+        # Bloques/líneas por página caben holgadamente en 2**20
+        line_ids.append((page.number << 40) | (np.asarray(block, dtype=np.int64) << 20) | np.asarray(line, dtype=np.int64))
+        word_nos.append(np.asarray(word_no, dtype=np.int64))
+
+    def cat(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    text_arr = cat(texts, str)
+    return PageIndex(
+        page=cat(pages, np.int64),
+        x0=cat(x0s, float), y0=cat(y0s, float), x1=cat(x1s, float), y1=cat(y1s, float),
+        text=text_arr,
+        line_id=cat(line_ids, np.int64),
+        line_start=cat(word_nos, np.int64) == 0,
+        number=parse_question_tokens(text_arr),
+        page_w=page_w,
+        page_h=page_h,
+    )
+
+
+# -------------------- 2) Columnas --------------------
+
+def detect_columns(index: PageIndex,
+                   body: np.ndarray,
+                   min_gutter_pt: float = 12.0,
+                   gutter_tolerance: int = 2,
+                   band: tuple[float, float] = (0.3, 0.7),
+                   min_side_share: float = 0.2,
+                   max_blocked_share: float = 0.1,
+                   min_column_lines: int = 5,
+                   align_tolerance_pt: float = 2.0) -> np.ndarray:
+    """
+    Posición x de la separación entre columnas por página (np.inf = una sola columna).
+
+    Se acumula cuántas palabras (del cuerpo, sin encabezado/pie) cubren cada punto x de la
+    página; un tramo de al menos 'min_gutter_pt' dentro de 'band' con cobertura
+    <= 'gutter_tolerance' (títulos centrados que lo cruzan) es el canal entre columnas.
+    Ambos lados deben tener al menos 'min_side_share' de las palabras de la página.
+
+    Un canal así también aparece en páginas a una columna con preguntas cortas (el enunciado
+    lo cruza en una o dos líneas y a la derecha hay poco texto). Por eso además se exige:
+    - que las palabras que cruzan el canal sumen a lo más 'max_blocked_share' del alto del
+      cuerpo de la página, y
+    - que la columna derecha tenga sus propios inicios de línea alineados: al menos
+      'min_column_lines' líneas que empiezan a la misma x (+- 'align_tolerance_pt').
+    """
+    n_pages = index.n_pages
+    split = np.full(n_pages, np.inf)
+    if n_pages == 0 or not body.any():
+        return split
+
+    n_bins = int(np.ceil(index.page_w.max())) + 2
+    page = index.page[body]
+    b0 = np.clip(np.floor(index.x0[body]).astype(np.int64), 0, n_bins - 1)
+    b1 = np.clip(np.ceil(index.x1[body]).astype(np.int64), 0, n_bins - 1)
+
+    # Cobertura por página con un arreglo de diferencias: +1 al inicio, -1 al final de cada palabra
+    diff = np.zeros((n_pages, n_bins), dtype=np.int64)
+    np.add.at(diff, (page, b0), 1)
+    np.add.at(diff, (page, b1), -1)
+    coverage = np.cumsum(diff, axis=1)
+
+    xs = np.arange(n_bins)
+    in_band = (xs[None, :] >= band[0] * index.page_w[:, None]) & (xs[None, :] <= band[1] * index.page_w[:, None])
+    open_gap = (coverage <= gutter_tolerance) & in_band
+
+    # Largo del tramo abierto que termina en cada x (se reinicia en cada x cerrado)
+    last_closed = np.maximum.accumulate(np.where(open_gap, -1, xs[None, :]), axis=1)
+    run_len = xs[None, :] - last_closed
+    run_len[~open_gap] = 0
+    best_end = run_len.argmax(axis=1)
+    best_len = run_len[np.arange(n_pages), best_end]
+    candidate_split = best_end - best_len / 2.0
+
+    # Ambos lados con suficiente texto
+    words_per_page = np.bincount(page, minlength=n_pages)
+    left_words = np.bincount(page, weights=(index.x1[body] <= candidate_split[page]).astype(float),
+                             minlength=n_pages)
+    right_share = (words_per_page - left_words) / np.maximum(words_per_page, 1)
+    left_share = left_words / np.maximum(words_per_page, 1)
+
+    # Alto del cuerpo bloqueado por palabras que cruzan el canal
+    x0, x1, y0, y1 = index.x0[body], index.x1[body], index.y0[body], index.y1[body]
+    crosses = (x0 < candidate_split[page]) & (x1 > candidate_split[page])
+    blocked = np.bincount(page, weights=np.where(crosses, y1 - y0, 0.0), minlength=n_pages)
+    top = np.full(n_pages, np.inf)
+    bottom = np.full(n_pages, -np.inf)
+    np.minimum.at(top, page, y0)
+    np.maximum.at(bottom, page, y1)
+    blocked_share = blocked / np.maximum(bottom - top, 1.0)
+
+    # Inicios de línea alineados a la derecha del canal: máximo por página de líneas por x
+    right_start = index.line_start[body] & (x0 >= candidate_split[page])
+    slot = np.round(x0[right_start] / align_tolerance_pt).astype(np.int64)
+    keys, counts = np.unique(page[right_start] * (n_bins + 1) + slot, return_counts=True)
+    aligned = np.zeros(n_pages, dtype=np.int64)
+    np.maximum.at(aligned, keys // (n_bins + 1), counts)
+
+    two_cols = ((best_len >= min_gutter_pt) & (left_share >= min_side_share) & (right_share >= min_side_share)
+                & (blocked_share <= max_blocked_share) & (aligned >= min_column_lines))
+    split[two_cols] = candidate_split[two_cols]
+    return split
+
+
+# -------------------- 3) Plan --------------------
+
+def _group_min(groups: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    out = np.full(n_groups, np.inf)
+    np.minimum.at(out, groups, values)
+    return out
+
+def _group_max(groups: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    out = np.full(n_groups, -np.inf)
+    np.maximum.at(out, groups, values)
+    return out
+
+def running_text_mask(index: PageIndex, min_share: float = 0.3, min_pages: int = 3) -> np.ndarray:
+    """
+    Palabras de encabezados/pies repetidos: mismo texto a la misma altura (redondeada) en al
+    menos 'min_share' de las páginas. Así el contenido "sobre la primera pregunta" de una
+    página no confunde el encabezado del facsímil con la continuación de una pregunta.
+
+    Se marcan líneas completas: todas sus palabras repetidas o sólo números ("- 17 -": el
+    número de página cambia pero es parte del pie), y en el cuarto superior o inferior de
+    la página. Palabras comunes ("de", "la") repetidas dentro de líneas del cuerpo no cuentan.
+    """
+    if len(index.page) == 0:
+        return np.zeros(0, dtype=bool)
+    keys = np.char.add(np.char.add(index.text, "@"), np.round(index.y0).astype(np.int64).astype(str))
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    repeated = counts[inverse] >= max(min_pages, min_share * index.n_pages)
+
+    _, line = np.unique(index.line_id, return_inverse=True)
+    n_lines = line.max() + 1
+    any_repeated = np.zeros(n_lines, dtype=bool)
+    np.logical_or.at(any_repeated, line, repeated)
+    all_running = np.ones(n_lines, dtype=bool)
+    np.logical_and.at(all_running, line, repeated | np.char.isdigit(np.char.strip(index.text)))
+    edge = (index.y1 <= 0.25 * index.page_h[index.page]) | (index.y0 >= 0.75 * index.page_h[index.page])
+    return (any_repeated & all_running)[line] & edge
+
+def _dominant_height_mask(heights: np.ndarray, tolerance_pt: float = 1.0) -> np.ndarray:
+    """Conserva los candidatos con la altura de letra más frecuente (los números de pregunta
+    comparten estilo; las listas de instrucciones y tablas suelen ir en letra de cuerpo)."""
+    if len(heights) == 0:
+        return np.zeros(0, dtype=bool)
+    bins, counts = np.unique(np.round(heights * 2) / 2, return_counts=True)
+    return np.abs(heights - bins[counts.argmax()]) <= tolerance_pt
+
+def _longest_sequence_mask(numbers: np.ndarray, max_gap: int = 5) -> np.ndarray:
+    """
+    Conserva la cadena más larga de candidatos cuya numeración avanza de a 1 (tolerando
+    saltos de hasta 'max_gap' por números no detectados) en orden de lectura. Descarta
+    listas numeradas de instrucciones, valores de tablas, etc.
+
+    El siguiente de cada candidato se busca con searchsorted y el largo de cada cadena con
+    saltos de punteros (log n pasadas vectorizadas).
+    """
+    n = len(numbers)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    pos = np.arange(n)
+    keys = numbers * n + pos
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    nxt = np.full(n, -1)
+    for gap in range(1, max_gap + 1):
+        j = np.searchsorted(sorted_keys, (numbers + gap) * n + pos + 1)
+        found = (j < n) & (nxt < 0)
+        found[found] = sorted_keys[j[found]] // n == numbers[found] + gap
+        nxt[found] = order[j[found]]
+
+    # Largo de la cadena desde cada candidato (list ranking por duplicación de punteros)
+    length = (nxt >= 0).astype(np.int64)
+    ptr = nxt.copy()
+    while (ptr >= 0).any():
+        step = ptr >= 0
+        length[step] += length[ptr[step]]
+        ptr[step] = ptr[ptr[step]]
+    # 'length' cuenta saltos. En empates se toma el inicio más tardío: una lista de
+    # instrucciones 1..k previa empalma con la pregunta k+1 y da una cadena igual de larga.
+    keep = np.zeros(n, dtype=bool)
+    i = n - 1 - int(length[::-1].argmax())
+    while i >= 0:
+        keep[i] = True
+        i = nxt[i]
+    return keep
+
+def build_question_plan(doc: fitz.Document,
+                        padding: float,
+                        left_ratio: float | None = 0.143,
+                        *,
+                        index: PageIndex | None = None,
+                        labels: tuple[str, ...] = ("PREGUNTA",),
+                        multi_column: bool = True,
+                        continuations: bool = True,
+                        max_full_regions: int = 0,
+                        sequence: bool | None = None,
+                        max_gap: int = 5,
+                        header_cm: float = 1.5,
+                        footer_cm: float = 1.5,
+                        edge_tolerance_pt: float = 6.0,
+                        min_continuation_pt: float = 12.0) -> pd.DataFrame:
+    """
+    Calcula el plan de recortes del documento con operaciones vectorizadas.
+
+    - left_ratio: ancho de la franja de números relativo a la columna (como en el motor
+      clásico). None = franja adaptativa: el borde izquierdo del texto de cada columna
+      (percentil 5 de los inicios de línea) más 'edge_tolerance_pt'; evita calibrar por PDF.
+    - labels: encabezados tipo "PREGUNTA 12" (solucionarios PSU). Si el documento los tiene,
+      se usan sólo esos y se ignoran los números sueltos del margen.
+    - Encabezados y pies repetidos en muchas páginas no cuentan como contenido.
+    - sequence: filtrar ruido; se conservan los candidatos con la altura de letra dominante y,
+      de ellos, la cadena más larga de numeración creciente con saltos de a lo más 'max_gap'
+      (por defecto, activo con la franja adaptativa o con encabezados; con encabezados no se
+      filtra por altura).
+    - continuations: la última pregunta de cada columna continúa en la siguiente columna/
+      página: hasta 'max_full_regions' columnas/páginas completas sin preguntas y luego el
+      contenido previo a la primera pregunta de la región siguiente.
+
+    Retorna un DataFrame con PLAN_COLUMNS; 'segments' es la lista de recortes
+    (page, x0, y0, x1, y1) de cada pregunta, en orden de lectura.
+    """
+    if index is None:
+        index = build_page_index(doc)
+    n_pages = index.n_pages
+    if n_pages == 0 or len(index.page) == 0:
+        return pd.DataFrame(columns=PLAN_COLUMNS)
+
+    W, H = index.page_w, index.page_h
+    wp = index.page
+    body = (index.y0 >= header_cm * PT_PER_CM) & (index.y1 <= H[wp] - footer_cm * PT_PER_CM)
+    body &= ~running_text_mask(index)
+
+    # --- Columnas y región (página, columna) de cada palabra ---
+    split = detect_columns(index, body) if multi_column else np.full(n_pages, np.inf)
+    col = (index.x0 >= split[wp]).astype(np.int64)
+    region = wp * MAX_COLUMNS + col
+    n_regions = n_pages * MAX_COLUMNS
+    region_ids = np.arange(n_regions)
+    region_page = region_ids // MAX_COLUMNS
+    region_col = region_ids % MAX_COLUMNS
+    region_valid = (region_col == 0) | np.isfinite(split[region_page])
+    region_x0 = np.where(region_col == 0, 0.0, split[region_page])
+    region_x1 = np.where((region_col == 0) & np.isfinite(split[region_page]), split[region_page], W[region_page])
+
+    # --- Candidatos con encabezado ("PREGUNTA 12"): palabra rótulo + número en la misma línea ---
+    anchor = np.empty(0, dtype=np.int64)
+    if labels and len(wp) > 1:
+        is_label = np.isin(np.char.upper(np.char.strip(index.text)), [l.upper() for l in labels])
+        same_line = index.line_id[1:] == index.line_id[:-1]
+        anchor = np.flatnonzero(is_label[:-1] & index.line_start[:-1] & same_line & (index.number[1:] >= 0))
+    cand_number_src = anchor + 1
+    labelled = len(anchor) > 0
+
+    # --- Si no hay encabezados: números sueltos en la franja izquierda de cada región ---
+    if not labelled:
+        # Regiones inexistentes (columna derecha de páginas a una columna): franja vacía
+        strip_x1 = np.full(n_regions, -np.inf)
+        if left_ratio is not None:
+            v = region_valid
+            strip_x1[v] = region_x0[v] + left_ratio * (region_x1[v] - region_x0[v])
+        else:
+            starts = index.line_start & body
+            order = np.lexsort((index.x0[starts], region[starts]))
+            s_region, s_x0 = region[starts][order], index.x0[starts][order]
+            counts = np.bincount(s_region, minlength=n_regions)
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            pick = offsets + np.floor(0.05 * np.maximum(counts - 1, 0)).astype(np.int64)
+            edge = region_x0.copy()
+            has_lines = counts > 0
+            edge[has_lines] = s_x0[pick[has_lines]]
+            strip_x1[region_valid] = edge[region_valid] + edge_tolerance_pt
+
+        is_cand = (index.x0 < strip_x1[region]) & (index.number >= 0)
+        if left_ratio is None:
+            is_cand &= index.line_start
+        anchor = cand_number_src = np.flatnonzero(is_cand)
+        if sequence is None:
+            sequence = left_ratio is None
+    elif sequence is None:
+        sequence = True
+
+    # --- Candidatos en orden de lectura ---
+    order = np.lexsort((index.y0[anchor], region[anchor]))
+    anchor, cand_number_src = anchor[order], cand_number_src[order]
+    if sequence:
+        if not labelled:
+            keep = _dominant_height_mask(index.y1[anchor] - index.y0[anchor])
+            anchor, cand_number_src = anchor[keep], cand_number_src[keep]
+        keep = _longest_sequence_mask(index.number[cand_number_src], max_gap=max_gap)
+        anchor, cand_number_src = anchor[keep], cand_number_src[keep]
+    if len(anchor) == 0:
+        return pd.DataFrame(columns=PLAN_COLUMNS)
+
+    c_region = region[anchor]
+    c_page = wp[anchor]
+    y_top = index.y0[anchor] + padding
+    page_bottom = H[c_page] - padding
+
+    # y_bottom = y_top de la siguiente pregunta de la misma región; la última llega al pie
+    same_next = np.zeros(len(anchor), dtype=bool)
+    same_next[:-1] = c_region[1:] == c_region[:-1]
+    next_top = np.concatenate((y_top[1:], [np.nan]))
+    y_bottom = np.where(same_next, next_top, page_bottom)
+
+    # Correcciones de seguridad (igual que el motor clásico)
+    bad = (y_bottom <= y_top) | ((y_bottom - y_top) < 1)
+    y_bottom = np.where(bad, page_bottom, y_bottom)
+
+    # --- Continuaciones (sólo para la última pregunta de cada región) ---
+    first_q_top = _group_min(c_region, index.y0[anchor], n_regions)
+    content_top = _group_min(region[body], index.y0[body], n_regions)
+    content_bottom = _group_max(region[body], index.y1[body], n_regions)
+    has_cand = np.isfinite(first_q_top)
+    has_content = np.isfinite(content_top) & region_valid
+
+    # Primera región con preguntas estrictamente después de cada región (n_regions si no hay)
+    cand_ids = np.where(has_cand & region_valid, region_ids, n_regions)
+    next_cand = np.concatenate((np.minimum.accumulate(cand_ids[::-1])[::-1][1:], [n_regions]))
+    # Regiones válidas con contenido entre una región y la siguiente con preguntas
+    content_before = np.concatenate(([0], np.cumsum(has_content)))
+    n_between = content_before[next_cand] - content_before[region_ids + 1]
+
+    last_in_region = ~same_next
+    cont_ok = np.zeros(len(anchor), dtype=bool)
+    if continuations:
+        nc = next_cand[c_region]
+        nc_safe = np.minimum(nc, n_regions - 1)
+        cont_ok = last_in_region & (n_between[c_region] <= max_full_regions)
+        partial_ok = cont_ok & (nc < n_regions) & (content_top[nc_safe] < first_q_top[nc_safe] - min_continuation_pt)
+
+    # --- Plan ---
+    segments = []
+    for i in range(len(anchor)):
+        r = c_region[i]
+        segs = [(int(c_page[i]), float(region_x0[r]), float(y_top[i]), float(region_x1[r]), float(y_bottom[i]))]
+        if cont_ok[i]:
+            nc = next_cand[r]
+            for full in np.flatnonzero(has_content[r + 1:nc]) + r + 1:
+                segs.append((int(region_page[full]), float(region_x0[full]), float(max(content_top[full] - 2.0, 0.0)),
+                             float(region_x1[full]), float(content_bottom[full] + 2.0)))
+            if partial_ok[i]:
+                segs.append((int(region_page[nc]), float(region_x0[nc]), float(max(content_top[nc] - 2.0, 0.0)),
+                             float(region_x1[nc]), float(first_q_top[nc] + padding)))
+            if len(segs) > 1:
+                # Al continuar, el primer tramo termina en el contenido (sin el pie de página)
+                x0, y0, x1, y1 = segs[0][1:]
+                segs[0] = (segs[0][0], x0, y0, x1, float(max(min(y1, content_bottom[r] + 2.0), y0 + 1)))
+        segments.append(segs)
+
+    return pd.DataFrame({
+        "page": c_page,
+        "question_number": index.number[cand_number_src],
+        "y_top": y_top,
+        "y_bottom": y_bottom,
+        "W": W[c_page],
+        "H": H[c_page],
+        "segments": segments,
+    }, columns=PLAN_COLUMNS)
@@ -7,11 +7,16 @@ import pandas as pd
 from collections import defaultdict
 from collections.abc import Mapping
 import re
+import time
 from datetime import datetime
 
 from io import BytesIO
 from PIL import Image
 
+from core.stages import STAGES_BY_NAME, Stage, get_stages
+from core.telemetry import (Budget, BudgetExceeded, UsageTracker, image_tokens_estimate,
+                            text_tokens_estimate, usage_to_dict)
+
 def img_to_data_uri(path_str: str) -> str:
     p = Path(path_str)
     img = Image.open(p).convert("RGB")
@@ -63,41 +68,71 @@ def build_rows(df_questions: pd.DataFrame, qids=None):
     # devolvemos el id normalizado para que case con tus dicts
     return list(df2[["qid_norm", "lowq_path"]].itertuples(index=False, name=None))
 
+def missing_image_qids(rows) -> set:
+    """qids de 'rows' (build_rows) cuya imagen lowq ya no existe en disco."""
+    return {qid for qid, path in rows if not Path(str(path)).exists()}
+
 def chunked(iterable, n):
     """Yield lists of length n (last one may be shorter)."""
     iterable = list(iterable)
     for i in range(0, len(iterable), n):
         yield iterable[i:i+n]
 
-def merge_json_dicts(dst: dict, src: dict) -> dict:
-    """Shallow-merge JSON dicts like {"PREGUNTA_1": {...}}."""
-    if not src:
-        return dst
-    for k, v in src.items():
-        dst[k] = v
-    return dst
-
-def consulta_openai(client, PROMPT, rows, input_text, model="gpt-5-nano"):
-    """Hace un único request multimodal (texto + varias imágenes). Si rows está vacío, retorna {}."""
+def consulta_openai(client, PROMPT, rows, input_text, model="gpt-5-nano",
+                    stage=None, tracker: UsageTracker | None = None, max_retries=2):
+    """Hace un único request multimodal (texto + varias imágenes). Si rows está vacío, retorna {}.
+    Reintenta hasta max_retries veces (error de API o JSON inválido) y registra uso en 'tracker'."""
     rows = list(rows)  # asegurar re-iterable
     if not rows:
         return {}
 
     content_user = [{"type": "input_text", "text": input_text}]
+    n_images, image_tokens = 0, 0
     for qid, path in rows:
         qid = str(qid); path = str(path)
         if not Path(path).exists():
             continue
         content_user.append({"type": "input_text", "text": f"PREGUNTA_{qid}:"})
         content_user.append({"type": "input_image", "image_url": img_to_data_uri(path)})
+        with Image.open(path) as im:
+            image_tokens += image_tokens_estimate(*im.size)
+        n_images += 1
 
     input_data = [
         {"role": "system", "content": [{"type": "input_text", "text": PROMPT}]},
         {"role": "user",   "content": content_user},
     ]
 
-    response = client.responses.create(model=model, input=input_data)  # type: ignore
-    data_dict = parseo_json(response)
+    if tracker is not None:
+        # Se decide con la estimación de esta llamada: el tope no se pasa por un batch entero
+        text = PROMPT + "".join(c["text"] for c in content_user if c["type"] == "input_text")
+        model = tracker.choose_model(model, text_tokens_estimate(text) + image_tokens)  # puede lanzar BudgetExceeded
+
+    usage: dict = defaultdict(int)  # suma de todos los intentos (los fallidos también se cobran)
+    retries = 0
+    inicio = time.perf_counter()
+    while True:
+        try:
+            response = client.responses.create(model=model, input=input_data)  # type: ignore
+            for k, v in usage_to_dict(getattr(response, "usage", None)).items():
+                usage[k] += v
+            data_dict = parseo_json(response)
+            ok = True
+            break
+        except Exception as e:
+            if retries >= max_retries:
+                ok = False
+                error = e
+                break
+            retries += 1
+            print(f"[WARN] consulta_openai reintento {retries}/{max_retries} ({stage}): {e}")
+            time.sleep(2 ** retries)
+
+    if tracker is not None:
+        tracker.record(stage=stage, model=model, usage=usage, latency_s=time.perf_counter() - inicio,
+                       retries=retries, images=n_images, image_tokens_est=image_tokens, ok=ok)
+    if not ok:
+        raise error
     return data_dict
 
 def _merge_values(a, b):
@@ -148,312 +183,228 @@ def merge_question_dicts(list_dicts):
                 result[pregunta] = payload
     return dict(result)
 
-def consulta_batcheada(client, PROMPT, rows_all, input_text, model="gpt-5-nano", batch_size=8):
-    """Call consulta_openai in batches and merge responses."""
-    final = {}
-    rows_all = list(rows_all)  # ensure re-iterable
-    print(f"[INFO] input_text: {input_text[:60]}... Total preguntas: {len(rows_all)}")
-    for rows_batch in chunked(rows_all, batch_size):
+# -------------------- Resultados por etapa --------------------
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def load_stage_results(path: Path) -> dict:
+    """{etapa: {qid: {"key", "payload", "version", "model"}}} guardado por run_categorization."""
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_stage_results(stage_results: dict, path: Path):
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(stage_results, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+def stage_targets(stage: Stage, all_qids: list, stage_results: dict) -> list:
+    """Preguntas sobre las que corre la etapa: todas, o las que su etapa padre marcó con depends_label."""
+    if stage.depends_on is None:
+        return list(all_qids)
+    parent = STAGES_BY_NAME[stage.depends_on]
+    parent_results = stage_results.get(parent.name, {})
+    targets = []
+    for qid in all_qids:
+        payload = parent_results.get(qid, {}).get("payload", {})
+        if stage.depends_label in _as_list(payload.get(parent.output_keys[0])):
+            targets.append(qid)
+    return targets
+
+def adopt_legacy_dict(final_dict: dict) -> dict:
+    """
+    Reconstruye los resultados por etapa desde un dict_PAES_<doc>.json anterior al registro,
+    asumiendo que lo generaron los prompts actuales. Las sub-unidades (todas bajo la clave
+    'Sub-unidad') se reparten por etapa según el conjunto de rótulos de cada una.
+    """
+    stage_results: dict = {}
+    by_qid = {_normalize_qid(k): (k, v or {}) for k, v in final_dict.items()}
+    for stage in get_stages():
+        current = stage_results.setdefault(stage.name, {})
+        qids = stage_targets(stage, list(by_qid), stage_results)
+        for qid in qids:
+            raw_key, payload = by_qid[qid]
+            stage_payload = {k: payload[k] for k in stage.output_keys if k in payload}
+            if not stage_payload:
+                continue
+            if stage.depends_on is not None and stage.labels:
+                stage_payload = {k: [x for x in _as_list(v) if x in stage.labels]
+                                 for k, v in stage_payload.items()}
+            current[qid] = {"key": raw_key, "payload": stage_payload,
+                            "version": stage.version(), "model": stage.model}
+    return stage_results
+
+def pending_stage_results(all_qids: list, stage_results: dict, skip: set | None = None) -> dict:
+    """
+    {etapa: [qid, ...]} de las preguntas sin resultado de la versión actual del prompt (con
+    el modelo que sea: un downgrade por presupuesto cuenta como calculado). Vacío = completo.
+    Las preguntas de 'skip' (sin imagen, que run_stage no puede enviar) no cuentan.
+    """
+    skip = skip or set()
+    pending = {}
+    for stage in get_stages():
+        current = stage_results.get(stage.name, {})
+        missing = [q for q in stage_targets(stage, all_qids, stage_results)
+                   if q not in skip and
+                   (q not in current or current[q].get("version") != stage.version(current[q].get("model")))]
+        if missing:
+            pending[stage.name] = missing
+    return pending
+
+def build_final_dict(stage_results: dict) -> dict:
+    """Une los resultados de las etapas activas en el dict {"PREGUNTA_X": {...}} de salida."""
+    list_dicts = []
+    for stage in get_stages():
+        entries = stage_results.get(stage.name, {})
+        list_dicts.append({e["key"]: e["payload"] for e in entries.values()})
+    return merge_question_dicts(list_dicts)
+
+def run_stage(client, stage: Stage, rows, model: str, batch_size: int,
+              tracker: UsageTracker | None, current: dict):
+    """Corre una etapa en batches y guarda en 'current' el resultado de cada pregunta con la
+    versión (prompt + modelo efectivamente usado) que lo produjo."""
+    rows = [(qid, path) for qid, path in rows if Path(str(path)).exists()]
+    print(f"[INFO] Etapa {stage.name}: {len(rows)} preguntas por (re)calcular con {model}.")
+    for rows_batch in chunked(rows, batch_size):
         try:
-            out = consulta_openai(client, PROMPT, rows_batch, input_text, model=model)
-            merge_json_dicts(final, out)
-            print(f"[INFO] Batch procesado: {len(rows_batch)} preguntas.")
+            out = consulta_openai(client, stage.prompt, rows_batch, stage.input_text, model=model,
+                                  stage=stage.name, tracker=tracker)
+        except BudgetExceeded:
+            raise
         except Exception as e:
-            print(f"[ERROR] consulta_batcheada fallo en batch {rows_batch}: {e}")
+            print(f"[ERROR] Etapa {stage.name} fallo en batch {rows_batch}: {e}")
             break
-    return final
+
+        model_used = tracker.last_model if tracker is not None else model
+        version = stage.version(model_used)
+        batch_qids = {str(qid) for qid, _ in rows_batch}
+        for raw_key, payload in (out or {}).items():
+            qid = _normalize_qid(raw_key)
+            if qid not in batch_qids:
+                continue
+            unknown = [x for k in stage.output_keys for x in _as_list((payload or {}).get(k))
+                       if stage.labels and x not in stage.labels]
+            if unknown:
+                print(f"[WARN] Etapa {stage.name}, {raw_key}: rótulos fuera del registro {unknown}")
+            current[qid] = {"key": raw_key, "payload": payload or {}, "version": version, "model": model_used}
+        print(f"[INFO] Batch procesado: {len(rows_batch)} preguntas.")
 
 # -------------------- Función principal --------------------
 
-def categorize_questions(df_questions: pd.DataFrame):
-    dict_habilidades, dict_materia, dict_latex, dict_num, dict_alg_y_fun, dict_geom, dict_prob_y_est = {}, {}, {}, {}, {}, {}, {}
+def categorize_questions(df_questions: pd.DataFrame, model: str | None = None, batch_size=8,
+                         tracker: UsageTracker | None = None, stage_results: dict | None = None):
+    """
+    Corre las etapas del registro (core.stages) sobre df_questions y retorna el dict unificado.
+
+    'stage_results' (se actualiza in-place) trae lo calculado en corridas anteriores: sólo se
+    consulta al modelo por las preguntas sin resultado o cuyo resultado tiene otra versión de
+    la etapa (cambió el prompt, los rótulos o el modelo). 'model' reemplaza el de cada etapa.
+    """
+    if stage_results is None:
+        stage_results = {}
+    client = None
+    rows_all = build_rows(df_questions)
+    all_qids = [qid for qid, _ in rows_all]
+    no_image = missing_image_qids(rows_all)  # no se pueden enviar: no cuentan como pendientes
     try:
-        
-        # 1) Cliente
-        load_dotenv()
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-        # 2) ENTRADA: lista de (id_pregunta, ruta_png) materializada (se reusa varias veces)
-        rows = build_rows(df_questions)
-
-        # 3) Prompts
-        PROMPT_HABILIDADES = """
-        Devuelves SOLO un JSON válido de la forma:
-        {"<id_pregunta>": {"Habilidades":["Resolver Problemas"|"Modelar"|"Representar"|"Argumentar", ...]}, ...}
-
-        Tarea:
-        A partir de las IMÁGENES de preguntas PAES M1, clasifica TODAS las habilidades que se evidencian en cada pregunta (selección múltiple).
-
-        Definiciones (resumen operativo):
-        - Resolver Problemas: solucionar una situación problemática (contextualizada o no), aplicando cálculos/conocimientos/estrategias; opcionalmente interpretar/validar resultados.
-        - Modelar: traducir una situación real/científica a una expresión matemática (ecuación, función, inecuación, etc.) y/o usarla para responder sobre la situación.
-        - Representar: transferir/transformar información entre formas matemáticas (símbolos, tablas, gráficos, diagramas, recta, plano).
-        - Argumentar: reconocer/explicar/justificar validez de procedimientos, pasos deductivos, demostraciones, o detectar argumentos erróneos.
-
-        Reglas:
-        - Elige TODAS las habilidades que aplique(n) por pregunta.
-        - Si solo hay manipulación simbólica sin contexto → favorece Representar (no Modelar).
-        - Si hay contexto pero NO se traduce a expresión que describa la situación → no es Modelar.
-        - Si el foco es justificar o explicar por qué algo es válido → incluye Argumentar.
-        - Si el ítem da un modelo y solo pide cálculo directo sin decisiones → puede ser Resolver (rutinario), pero no Modelar per se.
-        - Usa exactamente estos rótulos: "Resolver Problemas", "Modelar", "Representar", "Argumentar".
-        - No agregues texto extra: SOLO el JSON pedido.
-        """
-
-        PROMPT_MATERIA = """
-        Devuelves SOLO un JSON válido de la forma:
-        {"<id_pregunta>": {"Unidad Temática": ["<unidad>", ...]}, ...}
-
-        Tarea:
-        Eres un experto en educación y evaluación. A partir de las IMÁGENES de preguntas PAES M1, clasifica TODAS las unidades temáticas que se evidencian en cada pregunta.
-
-        Definiciones (resumen operativo):
-        - Números: Conjunto de los Números Enteros y Racionales, Porcentaje, Potencias y Raíces Enésimas.
-        - Álgebra y Funciones: Expresiones algebráicas, Proporcionalidad, Ecuaciones e Inecuaciones de Primer Grado, Sistemas de Ecuaciones Lineales, Función Lineal y Afín, Función Cuadrática.
-        - Geometría: Figuras Geométricas, Cuerpos Geométricos, Transformaciones Isométricas.
-        - Probabilidad y Estadística: Representación de Datos a Través de Tablas y Gráficos, Medidas de Posición, Reglas de las Probabilidades.
-
-        Reglas:
-        - Elige TODAS las materias que aplique(n) por pregunta.
-        - Usa exactamente estos rótulos: "Números", "Álgebra y Funciones", "Geometría", "Probabilidad y Estadística"
-        - Si no hay expresiones algebráicas, entonces no es "Álgebra y Funciones".
-        - No agregues texto extra: SOLO el JSON pedido.
-        """
-
-        PROMPT_LATEX = """
-        Tarea:
-        A partir de las IMÁGENES de preguntas PAES M1, extrae el enunciado y alternativas en LaTeX.
-        Reglas:
-        - Si las alternativas son imágenes, ignóralas y pon "[Imagen_<n>.png]" en su lugar.
-        - Si el enunciado tiene imágenes, ignóralas y pon "[Imagen_<n>.png]" en su lugar.
-        - Si la pregunta no tiene una imagen adjunta, dejar una lista vacía.
-        - Devuelves SOLO un JSON válido de la forma:
-        {"<id_pregunta>": {"Enunciado": "<enunciado_latex>", "Alternativas": ["<alt1_latex>", "<alt2_latex>", ...]}, ...}
-        """
-
-        # 4) Textos de usuario
-        input_text_habilidades = (
-            "Clasifica las habilidades utilizadas en cada pregunta y devuelve SOLO el JSON pedido. "
-            "Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
-        )
-        input_text_materia = (
-            "Clasifica las materias utilizadas en cada pregunta y devuelve SOLO el JSON pedido. "
-            "Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
-        )
-        input_text_latex = (
-            "Redacta en formato LaTeX cada pregunta y devuelve SOLO el JSON pedido. "
-            "Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
-        )
-
-        # 5) Llamadas iniciales (batched de 5)
-        dict_habilidades = consulta_batcheada(client, PROMPT_HABILIDADES, rows, input_text_habilidades)
-        dict_materia     = consulta_batcheada(client, PROMPT_MATERIA,     rows, input_text_materia)
-        # dict_latex       = consulta_batcheada(client, PROMPT_LATEX,       rows, input_text_latex)
-
-        # 6) Derivar listas de qids por Unidad Temática desde dict_materia
-        rows_qid_num, rows_qid_alg_y_fun, rows_qid_geom, rows_qid_prob_y_est = [], [], [], []
-        for key_preg, data in (dict_materia or {}).items():
-            unidades = (data or {}).get("Unidad Temática", [])
-            if "Números" in unidades:
-                rows_qid_num.append(key_preg)
-            if "Álgebra y Funciones" in unidades:
-                rows_qid_alg_y_fun.append(key_preg)
-            if "Geometría" in unidades:
-                rows_qid_geom.append(key_preg)
-            if "Probabilidad y Estadística" in unidades:
-                rows_qid_prob_y_est.append(key_preg)
-
-        # 7) Construir rows por grupo (materializados)
-        rows_num        = build_rows(df_questions, rows_qid_num)
-        rows_alg_y_fun  = build_rows(df_questions, rows_qid_alg_y_fun)
-        rows_geom       = build_rows(df_questions, rows_qid_geom)
-        rows_prob_y_est = build_rows(df_questions, rows_qid_prob_y_est)
-
-        # 8) Prompts Sub-unidades
-        prompt_num = """
-        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
-        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
-
-        Rol:
-        Eres un experto en educación matemática escolar y evaluación PAES. Tu tarea es, a partir de IMÁGENES de preguntas PAES M1 (Unidad: Números), identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
-
-        Hay 3 grandes grupos: porcentajes, potencias y raíces, números enteros y racionales. Utilizando estos como referencia, clasifica según sub-unidad. 
-
-        Criterios de clasificación (usar exactamente estos nombres):
-
-        Sub-unidades de porcentajes:
-        - "Concepto y cálculo de porcentaje"
-        - "Problemas que involucren porcentaje"
-
-        Sub-unidades de potencias y raíces:
-        - "Propiedades de las potencias de base racional y exponente racional"
-        - "Descomposición y propiedades de las raíces enésimas en los números reales"
-        - "Problemas que involucren potencias y raíces enésimas en los números reales"
-
-        Otras sub-unidades de números enteros y racionales:
-        - "Operaciones y orden en el conjunto de los números enteros"
-        - "Operaciones y comparación entre números en el conjunto de los números racionales"
-        - "Problemas que involucren el conjunto de los números enteros y racionales"
-
-        Instrucciones estrictas:
-        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
-        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
-        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
-        - Si solo hay números enteros, entonces NO clasifiques como "Problemas que involucren el conjunto de los números enteros y racionales"
-        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
-        """
-        prompt_alg_y_fun = """
-        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
-        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
-
-        Rol:
-        Eres un experto en educación matemática escolar y evaluación PAES. A partir de IMÁGENES de preguntas PAES M1 (Unidad: Álgebra y Funciones), tu tarea es identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
-
-        Hay 6 grandes grupos: expresiones algebraicas, proporcionalidad, ecuaciones e inecuaciones de primer grado, sistemas de ecuaciones lineales, función lineal y afín, función cuadrática. Utilizando estos como referencia, clasifica según sub-unidad. 
-
-        Criterios de clasificación (usar exactamente estos nombres):
-        
-        Sub-unidades de expresiones algebraicas:
-        - "Productos notables"
-        - "Factorizaciones y desarrollo de expresiones algebraicas"
-        - "Operatoria con expresiones algebraicas"
-        - "Problemas que involucren expresiones algebraicas"
-
-        Sub-unidades de proporcionalidad:
-        - "Concepto de proporción directa e inversa"
-        - "Problemas que involucren proporción directa en inversa"
-
-        Sub-unidades de ecuaciones e inecuaciones de primer grado:
-        - "Resolución de ecuaciones lineales"
-        - "Problemas que involucren ecuaciones lineales"
-        - "Resolución de inecuaciones lineales"
-        - "Problemas que involucren inecuaciones lineales"
-
-        Sub-unidades de sistemas de ecuaciones lineales:
-        - "Resolución de sistemas de ecuaciones lineales"
-        - "Problemas que involucren sistemas de ecuaciones lineales"
-
-        Sub-unidades de función lineal y afín:
-        - "Concepto de función lineal y función afín"
-        - "Tablas y gráficos de función lineal y función afín"
-        - "Problemas que involucren función lineal y función afín"
-
-        Sub-unidades de función cuadrática:
-        - "Ecuaciones de segundo grado"
-        - "Tablas y gráficos de la función cuadrática"
-        - "Vértice, ceros de la función e intersección con los ejes, de la función cuadrática"
-        - "Función cuadrática"
-
-        Instrucciones estrictas:
-        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
-        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
-        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
-        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
-        """
-        prompt_geom = """
-        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
-        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
-
-        Rol:
-        Eres un experto en educación matemática escolar y evaluación PAES. A partir de IMÁGENES de preguntas PAES M1 (Unidad: Geometría), tu tarea es identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
-
-        Criterios de clasificación (usar exactamente estos nombres):
-        
-        Hay 3 grandes grupos: figuras geométricas, cuerpos geométricos y transformaciones isométricas. Utilizando estos como referencia, clasifica según sub-unidad. 
-
-        Sub-unidades de figuras geométricas:
-        - "Problemas que involucren el Teorema de Pitágoras en diversos contextos"
-        - "Perímetro y áreas de triángulos, paralelogramos, trapecios y círculos"
-        - "Problemas que involucren perímetro y áreas de triángulos, paralelogramos, trapecios y círculos en diversos contextos"
-
-        Sub-unidades de cuerpos geométricos:
-        - "Área de superficies de paralelepípedos y cubos"
-        - "Volumen de paralelepípedos y cubos"
-        - "Problemas que involucren área y volumen de paralelepípedos y cubos en diversos contextos"
-
-        Sub-unidades de transformaciones isométricas:
-        - "Puntos y vectores en el plano cartesiano"
-        - "Rotación, traslación y reflexión de figuras geométricas"
-        - "Problemas que involucren rotación, traslación y reflexión en diversos contextos"
-        
-        Instrucciones estrictas:
-        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
-        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
-        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
-        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
-        """
-        prompt_prob_y_est = """
-        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
-        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
-
-        Rol:
-        Eres un experto en educación matemática escolar y evaluación PAES. A partir de IMÁGENES de preguntas PAES M1 (Unidad: Probabilidad y estadística), tu tarea es identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
-
-        Criterios de clasificación (usar exactamente estos nombres):
-        
-        Hay 3 grandes grupos: representación de datos a través de tablas y gráficos, medidas de posición, reglas de las probabilidades. Utilizando estos como referencia, clasifica según sub-unidad. 
-
-        Sub-unidades de representación de datos a través de tablas y gráficos:
-        - "Tablas de frecuencia absoluta y relativa" 
-        - "Tipos de gráficos que permitan representar datos"
-        - "Promedio de un conjunto de datos"
-        - "Problemas que involucren tablas y gráficos en diversos contextos"
-
-        Sub-unidades de medidas de posición: 
-        - "Cuartiles y percentiles de uno o más grupos de datos" 
-        - "Diagrama de cajón para representar distribución de datos"
-        - "Problemas que involucren medidas de posición en diversos contextos"
-
-        Sub-unidades de reglas de las probabilidades:
-        - "Problemas que involucren probabilidad de un evento en diversos contextos" 
-        - "Problemas que involucren la regla aditiva y multiplicativa de probabilidades en diversos contextos"
-        
-        Instrucciones estrictas:
-        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
-        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
-        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
-        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
-        """
-
-        input_text_num        = "Clasifica las sub-unidades utilizadas en cada pregunta y devuelve SOLO el JSON pedido. Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
-        input_text_alg_y_fun  = "Clasifica las sub-unidades utilizadas en cada pregunta y devuelve SOLO el JSON pedido. Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
-        input_text_geom       = "Clasifica las sub-unidades utilizadas en cada pregunta y devuelve SOLO el JSON pedido. Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
-        input_text_prob_y_est = "Clasifica las sub-unidades utilizadas en cada pregunta y devuelve SOLO el JSON pedido. Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
-
-        # 9) Llamadas por grupo (evitando llamadas vacías)
-        dict_num        = consulta_batcheada(client, prompt_num,        rows_num,        input_text_num       )        if rows_num        else {}
-        dict_alg_y_fun  = consulta_batcheada(client, prompt_alg_y_fun,  rows_alg_y_fun,  input_text_alg_y_fun )        if rows_alg_y_fun  else {}
-        dict_geom       = consulta_batcheada(client, prompt_geom,       rows_geom,       input_text_geom      )        if rows_geom       else {}
-        dict_prob_y_est = consulta_batcheada(client, prompt_prob_y_est, rows_prob_y_est, input_text_prob_y_est)        if rows_prob_y_est else {}
+        for stage in get_stages():
+            stage_model = model or stage.model
+            current = stage_results.setdefault(stage.name, {})
+            targets = stage_targets(stage, all_qids, stage_results)
+
+            # Preguntas que ya no pertenecen a la etapa (cambió su materia): descartar
+            for qid in [q for q in current if q not in targets]:
+                del current[qid]
+
+            version = stage.version(stage_model)
+            stale = [q for q in targets if q not in no_image and current.get(q, {}).get("version") != version]
+            if not stale:
+                print(f"[INFO] Etapa {stage.name} al día ({len(targets)} preguntas, versión {version}).")
+                continue
+
+            if client is None:
+                load_dotenv()
+                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            run_stage(client, stage, build_rows(df_questions, stale), stage_model, batch_size, tracker, current)
+    except BudgetExceeded:
+        raise
     except Exception as e:
         print(f"[ERROR] categorize_questions fallo: {e}")
         pass
-    
-    # 10) Salida unificada
-    list_dicts = [
-        dict_habilidades, dict_materia, dict_latex, dict_num, dict_alg_y_fun, dict_geom, dict_prob_y_est
-    ]
-    
-    final_dict = merge_question_dicts(list_dicts)
-
-    return final_dict
 
-def run_categorization(df_questions: pd.DataFrame,output_path: str):
-    for doc in df_questions['pdf_file'].unique():
+    return build_final_dict(stage_results)
+
+def run_categorization(df_questions: pd.DataFrame,output_path: str, overwrite: bool = False,
+                       model: str | None = None, batch_size: int = 8, budget: Budget | None = None):
+    """Categoriza cada documento de df_questions y guarda dict_PAES_<doc>.json.
+
+    Retorna {doc: True/False} según si el documento quedó completo. dict_PAES_<doc>.json sólo
+    se escribe si todas las etapas tienen resultado para todas sus preguntas; un error de la
+    API, un batch fallido o el tope de presupuesto dejan el documento incompleto (False).
+
+    Junto a cada JSON se guarda stages_PAES_<doc>.json con el resultado y la versión de cada
+    etapa por pregunta: al volver a correr sólo se recalculan las etapas cuyo prompt o modelo
+    cambió, y sólo para las preguntas afectadas. overwrite=True (p.ej. PDF modificado) ignora
+    lo guardado y recalcula todo. Un dict_PAES anterior sin stages_PAES se adopta como
+    calculado con los prompts actuales.
+
+    El uso de tokens de cada llamada se escribe en metrics_categorizacion_<timestamp>_p<pid>.jsonl
+    (y un resumen por etapa/examen/modelo en ..._resumen.json); timestamp con microsegundos y
+    PID para que corridas simultáneas (trabajadores del modo vigilancia) no compartan archivo. Si se alcanza un tope de
+    'budget' la corrida se detiene: se guarda el avance por etapa pero no el dict del documento."""
+    stamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_p{os.getpid()}"
+    tracker = UsageTracker(output_path + f"metrics_categorizacion_{stamp}.jsonl", budget=budget)
+    completed = {doc: False for doc in df_questions['pdf_file'].unique()}
+    for doc in completed:
         try:
             df_doc = df_questions[df_questions['pdf_file'] == doc]
             final_dict_path = Path(output_path+f"dict_PAES_{doc}.json")
-            if not final_dict_path.exists():    
-                inicio = datetime.now()
-                final_dict = categorize_questions(df_doc)
-                final=datetime.now()
-                delta = final - inicio
-                print(f"Tiempo de ejecución {doc}: {delta}")
-
-                with final_dict_path.open("w", encoding="utf-8") as f: # type: ignore
-                    json.dump(final_dict, f, ensure_ascii=False, indent=2, sort_keys=True)
-            else:
-                print(f"El archivo {final_dict_path} ya existe. Se omite la categorización para {doc}.")
+            stages_path = Path(output_path+f"stages_PAES_{doc}.json")
+
+            stage_results: dict = {}
+            if overwrite:
+                pass
+            elif stages_path.exists():
+                stage_results = load_stage_results(stages_path)
+            elif final_dict_path.exists():
+                print(f"[INFO] {final_dict_path} sin registro de etapas: se adopta como versión actual.")
+                with final_dict_path.open("r", encoding="utf-8") as f:
+                    stage_results = adopt_legacy_dict(json.load(f))
+
+            tracker.exam = doc
+            inicio = datetime.now()
+            try:
+                final_dict = categorize_questions(df_doc, model=model, batch_size=batch_size,
+                                                  tracker=tracker, stage_results=stage_results)
+            finally:
+                save_stage_results(stage_results, stages_path)
+            final=datetime.now()
+            delta = final - inicio
+            print(f"Tiempo de ejecución {doc}: {delta}")
+
+            rows_doc = build_rows(df_doc)
+            no_image = missing_image_qids(rows_doc)
+            if no_image:
+                print(f"[WARN] {doc}: {len(no_image)} pregunta(s) sin imagen lowq en disco "
+                      f"({', '.join(sorted(no_image, key=lambda q: (len(q), q)))}); no se categorizan "
+                      "ni cuentan para dar el documento por completo. Vuelve a extraer para incluirlas.")
+            pending = pending_stage_results([qid for qid, _ in rows_doc], stage_results, skip=no_image)
+            if pending:
+                detail = ", ".join(f"{name}: {len(qids)}" for name, qids in pending.items())
+                print(f"[ERROR] {doc} quedó incompleto ({detail}); no se escribe {final_dict_path.name}.")
+                continue
+
+            with final_dict_path.open("w", encoding="utf-8") as f: # type: ignore
+                json.dump(final_dict, f, ensure_ascii=False, indent=2, sort_keys=True)
+            completed[doc] = True
+        except BudgetExceeded as e:
+            print(f"[ERROR] {e} Se detiene la categorización en {doc}.")
+            break
         except Exception as e:
             print(f"Error processing {doc}: {e}")
-    
\ No newline at end of file
+
+    if tracker.calls:
+        tracker.print_summary()
+        tracker.save_summary(output_path + f"metrics_categorizacion_{stamp}_resumen.json")
+    return completed
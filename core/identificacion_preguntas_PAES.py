@@ -1,3 +1,4 @@
+import math
 import os
 import re
 from datetime import datetime
@@ -6,6 +7,8 @@ from pathlib import Path
 import fitz  # PyMuPDF
 import pandas as pd
 
+from core.boundary_engine import build_page_index, build_question_plan, running_text_mask
+
 
 from pathlib import Path
 from PIL import Image
@@ -63,183 +66,353 @@ LEADING_NUM_RE = re.compile(r"^\s*(\d+)")
 QUESTION_TOKEN = re.compile(r"^\s*(\d{1,3})[.)]?\s*$")
 HAS_LATIN_LETTERS = re.compile(r"[A-Za-z]")  # simplificado (ajusta si necesitas unicode)
 
+QUESTION_COLUMNS = ["page", "question_number", "pdf_path", "png_path", "pdf_file", "lowq_path"]
 
-def get_questions(input_path: str,
-                  output_path: str,
-                  padding_cm: float = 0.5,
-                  left_ratio: float = 0.143) -> pd.DataFrame:
-    """
-    Extrae preguntas desde PDFs en 'input_path' recortando por la franja izquierda,
-    detectando tokens numéricos (1..3 dígitos) como 'n', 'n.', 'n)' en el margen.
-    Exporta cada pregunta como PDF y PNG en 'output_path' y retorna un DataFrame
-    con columnas: ['page', 'question_number', 'pdf_path', 'png_path', 'pdf_file'].
 
-    - Procesa por-PDF y concatena al final
-    - Calcula y_bottom por página
-    - Guarda Excel con timestamp para no sobreescribir.
+# --- Recorte ajustado al contenido ---
+
+def page_layout_rects(page: fitz.Page, footer_cm: float = 0.0,
+                      skip_words: set | None = None) -> list[fitz.Rect]:
     """
-    out_lowq_path = output_path +"lowq/"
-    os.makedirs(output_path, exist_ok=True)
-    os.makedirs(out_lowq_path, exist_ok=True)
+    Cajas de palabras, imágenes y dibujos vectoriales de la página (se lee una vez por página).
+    Se descartan fondos/marcos de página completa, lo que empieza dentro de los últimos
+    'footer_cm' de la página y las palabras de 'skip_words' (cajas (x0, y0, x1, y1) de
+    encabezados/pies repetidos, ver running_text_mask).
+    """
+    r = page.rect
+    footer_y = r.height - footer_cm * 72 / 2.54
+    skip_words = skip_words or set()
+
+    rects = [fitz.Rect(w[:4]) for w in page.get_text("words") if tuple(w[:4]) not in skip_words]
+    rects += [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+    for d in page.get_drawings():
+        dr = fitz.Rect(d["rect"])
+        if dr.width >= 0.95 * r.width and dr.height >= 0.95 * r.height:
+            continue  # fondo o marco de la página
+        rects.append(dr)
+
+    # Las líneas rectas tienen alto (o ancho) 0: no usar Rect.is_empty para filtrarlas
+    return [x for x in rects if x.x1 >= x.x0 and x.y1 >= x.y0 and x.y0 < footer_y]
+
+def content_bbox(rects: list[fitz.Rect], clip: fitz.Rect, margin: float = 4.0) -> fitz.Rect:
+    """
+    Caja mínima (más 'margin' puntos) que contiene el contenido de 'rects' dentro de 'clip'.
+    Si no hay contenido en el clip devuelve el clip completo.
+    """
+    inside = [r for r in rects
+              if r.x0 <= clip.x1 and r.x1 >= clip.x0 and r.y0 <= clip.y1 and r.y1 >= clip.y0]
+    if not inside:
+        return fitz.Rect(clip)
+    return fitz.Rect(
+        max(clip.x0, min(r.x0 for r in inside) - margin),
+        max(clip.y0, min(r.y0 for r in inside) - margin),
+        min(clip.x1, max(r.x1 for r in inside) + margin),
+        min(clip.y1, max(r.y1 for r in inside) + margin),
+    )
 
-    all_docs: list[pd.DataFrame] = []
+def render_zoom(rect: fitz.Rect, dpi: float, max_pixels: int | None = None) -> float:
+    """Zoom (px por punto) para 'dpi', reducido si el render superaría 'max_pixels' en total."""
+    zoom = dpi / 72
+    area = rect.width * rect.height
+    if max_pixels and area > 0 and area * zoom * zoom > max_pixels:
+        zoom = math.sqrt(max_pixels / area)
+    return zoom
 
-    # Conversión cm -> puntos
-    padding = padding_cm * 72 / 2.54
 
-    for pdf_file in os.listdir(input_path):
-        if not pdf_file.lower().endswith(".pdf"):
-            print(f"Skipping non-PDF file: {pdf_file}")
-            continue
+def legacy_question_plan(doc: fitz.Document, pdf_file: str, padding: float,
+                         left_ratio: float = 0.143) -> pd.DataFrame | None:
+    """
+    Motor clásico: tokens numéricos en la franja izquierda de cada página, y_bottom por
+    página. Retorna el plan (una fila por pregunta, con 'segments') o None si no hay preguntas.
+    """
+    # Función para obtener el rectángulo de recorte izquierdo por página
+    def left_clip(page: fitz.Page) -> fitz.Rect:
+        r = page.rect
+        return fitz.Rect(0, 0, left_ratio * r.width, r.height)
 
-        pdf_path = os.path.join(input_path, pdf_file)
+    #1) Detectar preguntas y páginas inválidas por PDF
+    records = []          # filas con (page, qnum, y_top, W, H)
+    invalid_pages = set() # páginas sin número pero con letras (según criterio)
+
+    for page in doc:
         try:
-            doc = fitz.open(pdf_path)
+            words = page.get_text("words", clip=left_clip(page)) #type: ignore
         except Exception as e:
-            print(f"[WARN] No se pudo abrir {pdf_path}: {e}")
+            print(f"[WARN] get_text fallo en {pdf_file} p.{page.number}: {e}")
             continue
 
-        if len(doc) == 0:
-            print(f"[WARN] PDF vacío: {pdf_file}")
-            doc.close()
-            continue
+        # Buscar tokens tipo "12", "12)", "12." en la franja izquierda
+        tokens = []
+        for x0, y0, x1, y1, w, *_ in words:
+            m = QUESTION_TOKEN.match(w)
+            if m:
+                tokens.append((int(m.group(1)), y0))
+
+        if tokens:
+            for qnum, y0 in tokens:
+                records.append({
+                    "page": page.number, # 0-based
+                    "question_number": qnum,
+                    "y_top": y0 + padding,
+                    "W": page.rect.width,
+                    "H": page.rect.height,
+                })
+        else:
+            # Si NO hay número, marcar inválida sólo si vemos letras en la franja
+            has_letters = any(HAS_LATIN_LETTERS.search(item[4]) for item in words)
+            if has_letters:
+                invalid_pages.add(page.number)
+
+    # Si no se detectó nada en este PDF, seguir
+    if not records:
+        return None
+
+    df_doc = pd.DataFrame(records)
+
+    # --- 2) Filtrar páginas inválidas dentro de ESTE PDF ---
+    if invalid_pages:
+        df_doc = df_doc.loc[~df_doc["page"].isin(invalid_pages)].copy()
+    if df_doc.empty:
+        return None
+
+    # --- 3) Calcular y_bottom por PÁGINA ---
+    df_doc = df_doc.sort_values(["page", "y_top"]).copy()
+    df_doc["y_bottom"] = df_doc.groupby("page")["y_top"].shift(-1)
+
+    # Para la última pregunta de cada página, usar H - padding
+    df_doc["y_bottom"] = df_doc["y_bottom"].fillna(df_doc["H"] - padding)
+
+    # Correcciones de seguridad
+    bad_mask = (df_doc["y_bottom"] <= df_doc["y_top"]) | ((df_doc["y_bottom"] - df_doc["y_top"]) < 1)
+    df_doc.loc[bad_mask, "y_bottom"] = df_doc["H"] - padding
+
+    # Un único segmento por pregunta: franja completa de la página
+    df_doc["segments"] = [
+        [(int(page), 0.0, float(y_top), float(W), float(y_bottom))]
+        for page, y_top, W, y_bottom in zip(df_doc["page"], df_doc["y_top"], df_doc["W"], df_doc["y_bottom"])
+    ]
+    return df_doc
+
+
+def stack_pixmaps(pixmaps: list) -> Image.Image:
+    """Apila verticalmente (fondo blanco) los renders de los segmentos de una pregunta."""
+    images = [Image.frombytes("RGB", (p.width, p.height), p.samples) for p in pixmaps]
+    canvas = Image.new("RGB", (max(im.width for im in images), sum(im.height for im in images)), "white")
+    y = 0
+    for im in images:
+        canvas.paste(im, (0, y))
+        y += im.height
+    return canvas
+
+
+def extract_pdf_questions(pdf_path: str,
+                          output_path: str,
+                          padding_cm: float = 0.5,
+                          left_ratio: float | None = 0.143,
+                          tight_crop: bool = False,
+                          crop_margin_pt: float = 4.0,
+                          footer_cm: float = 1.5,
+                          max_pixels: int | None = None,
+                          engine: str = "legacy",
+                          engine_kwargs: dict | None = None) -> pd.DataFrame | None:
+    """
+    Procesa UN PDF: detecta preguntas en la franja izquierda y exporta sus recortes
+    (PDF, PNG y JPG de baja calidad) en 'output_path'.
+
+    - tight_crop=True recorta cada pregunta a la caja de su texto, imágenes y dibujos
+      (más 'crop_margin_pt'), ignorando el pie de página ('footer_cm') y los encabezados/pies
+      que se repiten en las páginas del documento (p.ej. "FORMA 111 - 2024", "- 17 -").
+    - max_pixels limita los píxeles de cada imagen (PNG y JPG de baja calidad que se envía al
+      modelo): si el recorte los supera, se baja la resolución.
+    - engine="vector" usa core.boundary_engine (índice NumPy, columnas y continuaciones entre
+      páginas; left_ratio=None la franja se ajusta sola). 'engine_kwargs' van a build_question_plan.
+
+    Retorna el DataFrame del documento con columnas
+    ['page', 'question_number', 'pdf_path', 'png_path', 'pdf_file', 'lowq_path'],
+    o None si el PDF no se pudo abrir o no tiene preguntas detectables.
+    """
+    out_lowq_path = os.path.join(output_path, "lowq")
+    os.makedirs(output_path, exist_ok=True)
+    os.makedirs(out_lowq_path, exist_ok=True)
+
+    # Conversión cm -> puntos
+    padding = padding_cm * 72 / 2.54
+    pdf_file = os.path.basename(pdf_path)
+
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        print(f"[WARN] No se pudo abrir {pdf_path}: {e}")
+        return None
 
-        # Función para obtener el rectángulo de recorte izquierdo por página
-        def left_clip(page: fitz.Page) -> fitz.Rect:
-            r = page.rect
-            return fitz.Rect(0, 0, left_ratio * r.width, r.height)
-
-        #1) Detectar preguntas y páginas inválidas por PDF
-        records = []          # filas con (page, qnum, y_top, W, H)
-        invalid_pages = set() # páginas sin número pero con letras (según criterio)
-
-        for page in doc:
-            try:
-                words = page.get_text("words", clip=left_clip(page)) #type: ignore
-            except Exception as e:
-                print(f"[WARN] get_text fallo en {pdf_file} p.{page.number}: {e}")
-                continue
-
-            # Buscar tokens tipo "12", "12)", "12." en la franja izquierda
-            tokens = []
-            for x0, y0, x1, y1, w, *_ in words:
-                m = QUESTION_TOKEN.match(w)
-                if m:
-                    tokens.append((int(m.group(1)), y0))
-
-            if tokens:
-                for qnum, y0 in tokens:
-                    records.append({
-                        "page": page.number, # 0-based
-                        "question_number": qnum,
-                        "y_top": y0 + padding,
-                        "W": page.rect.width,
-                        "H": page.rect.height,
-                    })
+    if len(doc) == 0:
+        print(f"[WARN] PDF vacío: {pdf_file}")
+        doc.close()
+        return None
+
+    # --- 1-3) Plan de recortes: qué pregunta, en qué página(s) y con qué límites ---
+    # Índice de palabras (una lectura por página): lo usan el motor vectorial y el recorte ajustado
+    index = build_page_index(doc) if (engine == "vector" or tight_crop) else None
+
+    if engine == "vector":
+        plan = build_question_plan(doc, padding, left_ratio, index=index, **(engine_kwargs or {}))
+        plan = plan if not plan.empty else None
+    else:
+        plan = legacy_question_plan(doc, pdf_file, padding, left_ratio)
+    if plan is None:
+        doc.close()
+        return None
+
+    # --- 4) Exportar recortes de ESTE PDF y asignar rutas sólo a sus filas ---
+    pdf_paths, png_paths, low_quality_paths = [], [], []
+    base = os.path.splitext(pdf_file)[0]
+    layout_cache: dict[int, list[fitz.Rect]] = {}  # página -> cajas de contenido
+    running_words: dict[int, set] = {}             # página -> cajas de encabezados/pies repetidos
+    if tight_crop:
+        running = running_text_mask(index)
+        for page_no, *box in zip(index.page[running], index.x0[running], index.y0[running],
+                                 index.x1[running], index.y1[running]):
+            running_words.setdefault(int(page_no), set()).add(tuple(box))
+
+    for row in plan.itertuples(index=False):
+        try:
+            # Un recorte por segmento: más de uno si la pregunta continúa en otra columna/página
+            clips = []
+            for page_no, x0, y0, x1, y1 in row.segments:
+                q_clip = fitz.Rect(x0, y0, x1, y1)
+                if tight_crop:
+                    if page_no not in layout_cache:
+                        layout_cache[page_no] = page_layout_rects(doc[page_no], footer_cm=footer_cm,
+                                                                  skip_words=running_words.get(page_no))
+                    q_clip = content_bbox(layout_cache[page_no], q_clip, margin=crop_margin_pt)
+                clips.append((page_no, q_clip))
+            width = max(c.width for _, c in clips)
+            height = sum(c.height for _, c in clips)
+
+            # Crear PDF de la pregunta (segmentos apilados verticalmente)
+            out = fitz.open()
+            dst = out.new_page(width=width, height=height) #type: ignore
+            y = 0.0
+            for page_no, q_clip in clips:
+                dst.show_pdf_page(
+                    fitz.Rect(0, y, q_clip.width, y + q_clip.height),
+                    doc,
+                    page_no,
+                    clip=q_clip
+                )
+                y += q_clip.height
+
+            # iterrows convertía el número a float: se mantiene "_Pregunta_12.0" por compatibilidad
+            qname = float(row.question_number)
+            out_pdf = os.path.join(output_path, f"{base}_Pregunta_{qname}.pdf")
+            out_png = os.path.join(output_path, f"{base}_Pregunta_{qname}.png")
+            out_lowq = os.path.join(out_lowq_path, f"{base}_Pregunta_{qname}_lowq.jpg")
+            
+            out.save(out_pdf)
+            out.close()
+
+            # Crear PNG de la pregunta
+            dpi = 200
+            zoom = render_zoom(fitz.Rect(0, 0, width, height), dpi, max_pixels)
+            mat = fitz.Matrix(zoom, zoom)  # de puntos PDF a pixeles
+            pixmaps = [doc[page_no].get_pixmap(clip=q_clip, matrix=mat, alpha=False) #type: ignore
+                       for page_no, q_clip in clips]
+            if len(pixmaps) == 1:
+                pixmaps[0].save(out_png)
             else:
-                # Si NO hay número, marcar inválida sólo si vemos letras en la franja
-                has_letters = any(HAS_LATIN_LETTERS.search(item[4]) for item in words)
-                if has_letters:
-                    invalid_pages.add(page.number)
-
-        # Si no se detectó nada en este PDF, seguir
-        if not records:
-            doc.close()
-            continue
+                stack_pixmaps(pixmaps).save(out_png)
+            
+            # Crear imagen baja calidad
+            dpi = 130  # dots per inch
+            width_px = int((width * dpi / 72)/2) # reducir la imagen a la mitad
+            height_px = 1600
+            if max_pixels:
+                # Es la imagen que se envía al modelo: el tope de píxeles aplica también aquí
+                zoom = render_zoom(fitz.Rect(0, 0, width, height), dpi / 2, max_pixels)
+                width_px = min(width_px, max(int(width * zoom), 1))
+                height_px = min(height_px, max(int(height * zoom), 1))
+            reduce_image(out_png, out_lowq, quality=80, dpi=dpi, max_width=width_px, max_height=height_px)
+
+            pdf_paths.append(out_pdf)
+            png_paths.append(out_png)
+            low_quality_paths.append(out_lowq)
+        except Exception as e:
+            print(f"[WARN] Export falló en {pdf_file} p.{row.page} q.{row.question_number}: {e}")
+            pdf_paths.append(None)
+            png_paths.append(None)
+            low_quality_paths.append(None)
 
-        df_doc = pd.DataFrame(records)
+    df_doc = plan
+    df_doc["pdf_path"] = pdf_paths
+    df_doc["png_path"] = png_paths
+    df_doc["pdf_file"] = base
+    df_doc["lowq_path"] = low_quality_paths
 
-        # --- 2) Filtrar páginas inválidas dentro de ESTE PDF ---
-        if invalid_pages:
-            df_doc = df_doc.loc[~df_doc["page"].isin(invalid_pages)].copy()
-        if df_doc.empty:
-            doc.close()
-            continue
+    doc.close()
 
-        # --- 3) Calcular y_bottom por PÁGINA ---
-        df_doc = df_doc.sort_values(["page", "y_top"]).copy()
-        df_doc["y_bottom"] = df_doc.groupby("page")["y_top"].shift(-1)
+    # Columnas finales
+    return df_doc[QUESTION_COLUMNS]
 
-        # Para la última pregunta de cada página, usar H - padding
-        df_doc["y_bottom"] = df_doc["y_bottom"].fillna(df_doc["H"] - padding)
 
-        # Correcciones de seguridad
-        bad_mask = (df_doc["y_bottom"] <= df_doc["y_top"]) | ((df_doc["y_bottom"] - df_doc["y_top"]) < 1)
-        df_doc.loc[bad_mask, "y_bottom"] = df_doc["H"] - padding
+def list_pdf_files(input_path: str) -> list[str]:
+    """Nombres de los PDFs en 'input_path', en orden alfabético (orden de proceso estable)."""
+    pdf_files = []
+    for pdf_file in sorted(os.listdir(input_path)):
+        if not pdf_file.lower().endswith(".pdf"):
+            print(f"Skipping non-PDF file: {pdf_file}")
+            continue
+        pdf_files.append(pdf_file)
+    return pdf_files
 
-        # --- 4) Exportar recortes de ESTE PDF y asignar rutas sólo a sus filas ---
-        pdf_paths, png_paths, low_quality_paths = [], [], []
-        base = os.path.splitext(pdf_file)[0]
 
-        for _, row in df_doc.iterrows():
-            try:
-                W, H = float(row["W"]), float(row["H"])
-                y_top = float(row["y_top"])
-                y_bottom = float(row["y_bottom"])
-                q_clip = fitz.Rect(0, y_top, W, y_bottom)
+def get_questions(input_path: str,
+                  output_path: str,
+                  padding_cm: float = 0.5,
+                  left_ratio: float | None = 0.143,
+                  pdf_files: list[str] | None = None,
+                  save_excel: bool = True,
+                  **crop_kwargs) -> pd.DataFrame:
+    """
+    Extrae preguntas desde PDFs en 'input_path' recortando por la franja izquierda,
+    detectando tokens numéricos (1..3 dígitos) como 'n', 'n.', 'n)' en el margen.
+    Exporta cada pregunta como PDF y PNG en 'output_path' y retorna un DataFrame
+    con columnas: ['page', 'question_number', 'pdf_path', 'png_path', 'pdf_file'].
 
-                # Crear PDF de la pregunta
-                out = fitz.open()
-                dst = out.new_page(width=W, height=q_clip.height) #type: ignore
-                dst.show_pdf_page(
-                    fitz.Rect(0, 0, W, q_clip.height),
-                    doc,
-                    int(row["page"]),
-                    clip=q_clip
-                )
+    - Procesa por-PDF y concatena al final
+    - Calcula y_bottom por página
+    - Guarda Excel con timestamp para no sobreescribir.
+    - 'pdf_files' limita el proceso a esos nombres de archivo (p.ej. sólo los PDFs nuevos).
+    - 'crop_kwargs' (tight_crop, crop_margin_pt, footer_cm, max_pixels, engine, engine_kwargs)
+      se pasan a extract_pdf_questions.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    all_docs: list[pd.DataFrame] = []
 
-                out_pdf = os.path.join(output_path, f"{base}_Pregunta_{row['question_number']}.pdf")
-                out_png = os.path.join(output_path, f"{base}_Pregunta_{row['question_number']}.png")
-                out_lowq = os.path.join(out_lowq_path, f"{base}_Pregunta_{row['question_number']}_lowq.jpg")
-                
-                out.save(out_pdf)
-                out.close()
-
-                # Crear PNG de la pregunta
-                dpi = 200
-                mat = fitz.Matrix(dpi/72, dpi/72)  # de puntos PDF a pixeles
-                pix = doc[int(row["page"])].get_pixmap(clip=q_clip, matrix=mat, alpha=False) #type: ignore
-                pix.save(out_png)
-                
-                # Crear imagen baja calidad
-                dpi = 130  # dots per inch
-                width_px = int((W * dpi / 72)/2) # reducir la imagen a la mitad
-                reduce_image(out_png, out_lowq, quality=80, dpi=dpi, max_width=width_px)
-
-                pdf_paths.append(out_pdf)
-                png_paths.append(out_png)
-                low_quality_paths.append(out_lowq)
-            except Exception as e:
-                print(f"[WARN] Export falló en {pdf_file} p.{row['page']} q.{row['question_number']}: {e}")
-                pdf_paths.append(None)
-                png_paths.append(None)
-                low_quality_paths.append(None)
-
-        df_doc["pdf_path"] = pdf_paths
-        df_doc["png_path"] = png_paths
-        df_doc["pdf_file"] = base
-        df_doc["lowq_path"] = low_quality_paths
-
-        # Columnas finales
-        df_doc = df_doc[["page", "question_number", "pdf_path", "png_path", "pdf_file", "lowq_path"]]
-        all_docs.append(df_doc)
+    if pdf_files is None:
+        pdf_files = list_pdf_files(input_path)
 
-        doc.close()
+    for pdf_file in pdf_files:
+        pdf_path = os.path.join(input_path, pdf_file)
+        df_doc = extract_pdf_questions(pdf_path, output_path,
+                                       padding_cm=padding_cm, left_ratio=left_ratio, **crop_kwargs)
+        if df_doc is not None:
+            all_docs.append(df_doc)
 
     # --- 5) Unión final (sin reescrituras cruzadas) ---
     final_df = (
         pd.concat(all_docs, ignore_index=True)
         if all_docs else
-        pd.DataFrame(columns=["page", "question_number", "pdf_path", "png_path", "pdf_file", "lowq_path"])
+        pd.DataFrame(columns=QUESTION_COLUMNS)
     )
 
     # --- 6) Guardado (con timestamp para no sobrescribir) ---
-    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_xlsx = os.path.join(output_path, f"bbdd_PAES_{stamp}.xlsx")
-    try:
-        final_df.to_excel(out_xlsx, index=False)
-        print(f"[OK] Exportado Excel: {out_xlsx}")
-    except Exception as e:
-        print(f"[WARN] No se pudo escribir Excel '{out_xlsx}': {e}")
+    if save_excel:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        out_xlsx = os.path.join(output_path, f"bbdd_PAES_{stamp}.xlsx")
+        try:
+            final_df.to_excel(out_xlsx, index=False)
+            print(f"[OK] Exportado Excel: {out_xlsx}")
+        except Exception as e:
+            print(f"[WARN] No se pudo escribir Excel '{out_xlsx}': {e}")
 
     return final_df
@@ -49,27 +49,37 @@ def get_all_boxes(page, clip_rect=None, include_drawings=True):
     return boxes
 
 
-in_pdf  = "input/PAES/2023-22-11-30-paes-oficial-matematica1-p2023.pdf"
-out_pdf = "PRUEBA_PAES_2023.pdf"
+# Colores (RGB 0..1) por capa de get_all_boxes
+LAYER_COLORS = {
+    "blocks":   ((1, 0, 0),   0.9),  # red       NOT USEFUL
+    "lines":    ((0, 1, 0),   0.7),  # green
+    "spans":    ((0, 0, 1),   0.6),  # blue
+    "words":    ((1, 0, 1),   0.5),  # magenta
+    "images":   ((1, 0.5, 0), 1.0),  # orange
+    "drawings": ((0, 1, 1),   0.8),  # cyan
+    "links":    ((1, 1, 0),   1.0),  # yellow
+}
 
-doc = fitz.open(in_pdf)
-for page in doc:
-    W, H = page.rect.width, page.rect.height
-    # Optional: only the left 14.3% strip. Set clip=None to dr+ll page.
-    #clip = None
-    clip = fitz.Rect(0, 0, 0.143 * W, H)
+def explore_pdf(in_pdf, out_pdf, left_ratio=0.143, layers=("words",)):
+    """Dibuja sobre una copia del PDF las cajas de las capas pedidas.
+    left_ratio=None dibuja la página completa; si no, sólo la franja izquierda."""
+    doc = fitz.open(in_pdf)
+    for page in doc:
+        W, H = page.rect.width, page.rect.height
+        # Optional: only the left 14.3% strip. Set clip=None to draw the full page.
+        clip = None if left_ratio is None else fitz.Rect(0, 0, left_ratio * W, H)
 
-    boxes = get_all_boxes(page, clip_rect=clip, include_drawings=True)
+        boxes = get_all_boxes(page, clip_rect=clip, include_drawings="drawings" in layers)
 
-    # Draw each layer with its own color (RGB in 0..1)
-    #draw_rects(page, boxes["blocks"],   color=(1, 0, 0),   width=0.9)  # red       NOT USEFUL
-    #draw_rects(page, boxes["lines"],    color=(0, 1, 0),   width=0.7)  # green
-    #draw_rects(page, boxes["spans"],    color=(0, 0, 1),   width=0.6)  # blue
-    draw_rects(page, boxes["words"],    color=(1, 0, 1),   width=0.5)  # magenta
-    #draw_rects(page, boxes["images"],   color=(1, 0.5, 0), width=1.0)  # orange
-    #draw_rects(page, boxes["drawings"], color=(0, 1, 1),   width=0.8)  # cyan
-    #draw_rects(page, boxes["links"],    color=(1, 1, 0),   width=1.0)  # yellow
+        for layer in layers:
+            color, width = LAYER_COLORS[layer]
+            draw_rects(page, boxes[layer], color=color, width=width)
 
-doc.save(out_pdf)
-doc.close()
- 
\ No newline at end of file
+    doc.save(out_pdf)
+    doc.close()
+
+
+if __name__ == "__main__":
+    in_pdf  = "input/PAES/2023-22-11-30-paes-oficial-matematica1-p2023.pdf"
+    out_pdf = "PRUEBA_PAES_2023.pdf"
+    explore_pdf(in_pdf, out_pdf, left_ratio=0.143, layers=("words",))
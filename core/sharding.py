@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from core.identificacion_preguntas_PAES import QUESTION_COLUMNS, get_questions, list_pdf_files
+
+SHARDS_DIR = "shards"
+SHARD_MODES = ("hash", "round_robin")
+
+
+# -------------------- Asignación de PDFs a shards --------------------
+
+def shard_of(pdf_file: str, num_shards: int) -> int:
+    """Shard de un PDF por hash estable del nombre (no usar hash(): cambia entre procesos)."""
+    digest = hashlib.sha1(pdf_file.encode("utf-8")).hexdigest()
+    return int(digest, 16) % num_shards
+
+def select_shard(pdf_files: list[str], shard_index: int, num_shards: int, mode: str = "hash") -> list[str]:
+    """
+    Subconjunto determinista de 'pdf_files' para el shard 'shard_index' de 'num_shards'.
+
+    - "hash": partición por hash del nombre; agregar PDFs no mueve los ya asignados.
+    - "round_robin": el i-ésimo de cada N sobre la lista ordenada; reparte mejor la carga
+      pero la asignación cambia si cambia el conjunto de PDFs.
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index debe estar en [0, {num_shards}), no {shard_index}")
+    if mode not in SHARD_MODES:
+        raise ValueError(f"mode debe ser uno de {SHARD_MODES}, no {mode!r}")
+
+    pdf_files = sorted(pdf_files)
+    if mode == "hash":
+        return [f for f in pdf_files if shard_of(f, num_shards) == shard_index]
+    return pdf_files[shard_index::num_shards]
+
+def manifest_path(output_path: str, shard_index: int, num_shards: int) -> Path:
+    return Path(output_path) / SHARDS_DIR / f"manifest_{shard_index:03d}_of_{num_shards:03d}.json"
+
+
+# -------------------- Trabajador --------------------
+
+def run_shard(input_path: str,
+              output_path: str,
+              shard_index: int,
+              num_shards: int,
+              mode: str = "hash",
+              padding_cm: float = 0.5,
+              left_ratio: float | None = 0.143,
+              **crop_kwargs) -> pd.DataFrame:
+    """
+    Extrae sólo los PDFs de este shard y escribe su manifest en <output_path>/shards/.
+
+    Los recortes ya se nombran por PDF (<pdf>_Pregunta_<n>.*), así que shards distintos
+    nunca escriben el mismo archivo; el Excel con timestamp se reemplaza por el manifest.
+    'crop_kwargs' se pasan a get_questions y quedan en el manifest junto a los demás parámetros.
+    """
+    all_pdfs = list_pdf_files(input_path)
+    assigned = select_shard(all_pdfs, shard_index, num_shards, mode)
+    print(f"[INFO] Shard {shard_index}/{num_shards} ({mode}): {len(assigned)} de {len(all_pdfs)} PDFs.")
+
+    df_shard = get_questions(input_path, output_path, padding_cm=padding_cm, left_ratio=left_ratio,
+                             pdf_files=assigned, save_excel=False, **crop_kwargs)
+
+    manifest = {
+        "shard_index": shard_index,
+        "num_shards": num_shards,
+        "mode": mode,
+        "params": {"padding_cm": padding_cm, "left_ratio": left_ratio, **crop_kwargs},
+        "input_files": all_pdfs,
+        "assigned": assigned,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "rows": json.loads(df_shard.to_json(orient="records")),
+    }
+    out = manifest_path(output_path, shard_index, num_shards)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    # Escritura atómica: el merge nunca ve un manifest a medias
+    tmp = out.with_suffix(".json.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, out)
+    print(f"[OK] Manifest del shard: {out}")
+    return df_shard
+
+
+# -------------------- Merge --------------------
+
+def merge_shard_manifests(output_path: str, num_shards: int, save_excel: bool = True) -> pd.DataFrame:
+    """
+    Une los manifests de los N shards en el índice único que consume run_categorization.
+
+    Verifica que estén todos los shards, que usen los mismos parámetros y el mismo listado
+    de PDFs, y que cada PDF esté asignado a exactamente un shard. Las filas se ordenan por
+    PDF en el mismo orden que get_questions, así el resultado es idéntico a una corrida en
+    un solo nodo.
+    """
+    manifests = []
+    for i in range(num_shards):
+        path = manifest_path(output_path, i, num_shards)
+        if not path.exists():
+            raise FileNotFoundError(f"Falta el manifest del shard {i}: {path}")
+        with path.open("r", encoding="utf-8") as f:
+            manifests.append(json.load(f))
+
+    ref = manifests[0]
+    assigned_to: dict[str, int] = {}
+    for m in manifests:
+        if m["params"] != ref["params"] or m["input_files"] != ref["input_files"] or m["mode"] != ref["mode"]:
+            raise ValueError(f"El shard {m['shard_index']} se generó con otros parámetros o PDFs; "
+                             "vuelve a correr todos los shards con la misma configuración.")
+        for pdf_file in m["assigned"]:
+            if pdf_file in assigned_to:
+                raise ValueError(f"{pdf_file} aparece en los shards {assigned_to[pdf_file]} y {m['shard_index']}")
+            assigned_to[pdf_file] = m["shard_index"]
+
+    missing = set(ref["input_files"]) - set(assigned_to)
+    if missing:
+        raise ValueError(f"PDFs sin shard asignado: {sorted(missing)}")
+
+    # Agrupar filas por PDF base y reordenar según el listado de entrada
+    rows_by_doc: dict[str, list] = {}
+    for m in manifests:
+        for row in m["rows"]:
+            rows_by_doc.setdefault(row["pdf_file"], []).append(row)
+
+    ordered_rows = []
+    for pdf_file in ref["input_files"]:
+        ordered_rows.extend(rows_by_doc.get(os.path.splitext(pdf_file)[0], []))
+
+    final_df = pd.DataFrame(ordered_rows, columns=QUESTION_COLUMNS)
+    print(f"[OK] Merge de {num_shards} shards: {len(final_df)} preguntas de {len(ref['input_files'])} PDFs.")
+
+    if save_excel:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        out_xlsx = os.path.join(output_path, f"bbdd_PAES_{stamp}.xlsx")
+        try:
+            final_df.to_excel(out_xlsx, index=False)
+            print(f"[OK] Exportado Excel: {out_xlsx}")
+        except Exception as e:
+            print(f"[WARN] No se pudo escribir Excel '{out_xlsx}': {e}")
+
+    return final_df
@@ -0,0 +1,376 @@
+import hashlib
+import json
+from dataclasses import dataclass
+
+# -------------------- Definición de etapas --------------------
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Etapa de categorización: un prompt que se aplica a un conjunto de preguntas.
+
+    - output_keys: claves que la etapa aporta al payload de cada pregunta.
+    - labels: rótulos válidos de la etapa (vacío = texto libre, p.ej. LaTeX).
+    - depends_on / depends_label: la etapa sólo corre sobre las preguntas cuya etapa
+      'depends_on' incluye 'depends_label' (materia -> sub-unidad).
+    """
+    name: str
+    prompt: str
+    input_text: str
+    output_keys: tuple[str, ...]
+    labels: tuple[str, ...] = ()
+    depends_on: str | None = None
+    depends_label: str | None = None
+    model: str = "gpt-5-nano"
+    enabled: bool = True
+
+    def version(self, model: str | None = None) -> str:
+        """Hash del contenido que define el resultado: prompt, textos, rótulos y modelo."""
+        payload = json.dumps({
+            "prompt": self.prompt,
+            "input_text": self.input_text,
+            "output_keys": self.output_keys,
+            "labels": self.labels,
+            "model": model or self.model,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+# -------------------- Prompts --------------------
+
+PROMPT_HABILIDADES = """
+        Devuelves SOLO un JSON válido de la forma:
+        {"<id_pregunta>": {"Habilidades":["Resolver Problemas"|"Modelar"|"Representar"|"Argumentar", ...]}, ...}
+
+        Tarea:
+        A partir de las IMÁGENES de preguntas PAES M1, clasifica TODAS las habilidades que se evidencian en cada pregunta (selección múltiple).
+
+        Definiciones (resumen operativo):
+        - Resolver Problemas: solucionar una situación problemática (contextualizada o no), aplicando cálculos/conocimientos/estrategias; opcionalmente interpretar/validar resultados.
+        - Modelar: traducir una situación real/científica a una expresión matemática (ecuación, función, inecuación, etc.) y/o usarla para responder sobre la situación.
+        - Representar: transferir/transformar información entre formas matemáticas (símbolos, tablas, gráficos, diagramas, recta, plano).
+        - Argumentar: reconocer/explicar/justificar validez de procedimientos, pasos deductivos, demostraciones, o detectar argumentos erróneos.
+
+        Reglas:
+        - Elige TODAS las habilidades que aplique(n) por pregunta.
+        - Si solo hay manipulación simbólica sin contexto → favorece Representar (no Modelar).
+        - Si hay contexto pero NO se traduce a expresión que describa la situación → no es Modelar.
+        - Si el foco es justificar o explicar por qué algo es válido → incluye Argumentar.
+        - Si el ítem da un modelo y solo pide cálculo directo sin decisiones → puede ser Resolver (rutinario), pero no Modelar per se.
+        - Usa exactamente estos rótulos: "Resolver Problemas", "Modelar", "Representar", "Argumentar".
+        - No agregues texto extra: SOLO el JSON pedido.
+        """
+
+PROMPT_MATERIA = """
+        Devuelves SOLO un JSON válido de la forma:
+        {"<id_pregunta>": {"Unidad Temática": ["<unidad>", ...]}, ...}
+
+        Tarea:
+        Eres un experto en educación y evaluación. A partir de las IMÁGENES de preguntas PAES M1, clasifica TODAS las unidades temáticas que se evidencian en cada pregunta.
+
+        Definiciones (resumen operativo):
+        - Números: Conjunto de los Números Enteros y Racionales, Porcentaje, Potencias y Raíces Enésimas.
+        - Álgebra y Funciones: Expresiones algebráicas, Proporcionalidad, Ecuaciones e Inecuaciones de Primer Grado, Sistemas de Ecuaciones Lineales, Función Lineal y Afín, Función Cuadrática.
+        - Geometría: Figuras Geométricas, Cuerpos Geométricos, Transformaciones Isométricas.
+        - Probabilidad y Estadística: Representación de Datos a Través de Tablas y Gráficos, Medidas de Posición, Reglas de las Probabilidades.
+
+        Reglas:
+        - Elige TODAS las materias que aplique(n) por pregunta.
+        - Usa exactamente estos rótulos: "Números", "Álgebra y Funciones", "Geometría", "Probabilidad y Estadística"
+        - Si no hay expresiones algebráicas, entonces no es "Álgebra y Funciones".
+        - No agregues texto extra: SOLO el JSON pedido.
+        """
+
+PROMPT_LATEX = """
+        Tarea:
+        A partir de las IMÁGENES de preguntas PAES M1, extrae el enunciado y alternativas en LaTeX.
+        Reglas:
+        - Si las alternativas son imágenes, ignóralas y pon "[Imagen_<n>.png]" en su lugar.
+        - Si el enunciado tiene imágenes, ignóralas y pon "[Imagen_<n>.png]" en su lugar.
+        - Si la pregunta no tiene una imagen adjunta, dejar una lista vacía.
+        - Devuelves SOLO un JSON válido de la forma:
+        {"<id_pregunta>": {"Enunciado": "<enunciado_latex>", "Alternativas": ["<alt1_latex>", "<alt2_latex>", ...]}, ...}
+        """
+
+PROMPT_NUM = """
+        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
+        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
+
+        Rol:
+        Eres un experto en educación matemática escolar y evaluación PAES. Tu tarea es, a partir de IMÁGENES de preguntas PAES M1 (Unidad: Números), identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
+
+        Hay 3 grandes grupos: porcentajes, potencias y raíces, números enteros y racionales. Utilizando estos como referencia, clasifica según sub-unidad. 
+
+        Criterios de clasificación (usar exactamente estos nombres):
+
+        Sub-unidades de porcentajes:
+        - "Concepto y cálculo de porcentaje"
+        - "Problemas que involucren porcentaje"
+
+        Sub-unidades de potencias y raíces:
+        - "Propiedades de las potencias de base racional y exponente racional"
+        - "Descomposición y propiedades de las raíces enésimas en los números reales"
+        - "Problemas que involucren potencias y raíces enésimas en los números reales"
+
+        Otras sub-unidades de números enteros y racionales:
+        - "Operaciones y orden en el conjunto de los números enteros"
+        - "Operaciones y comparación entre números en el conjunto de los números racionales"
+        - "Problemas que involucren el conjunto de los números enteros y racionales"
+
+        Instrucciones estrictas:
+        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
+        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
+        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
+        - Si solo hay números enteros, entonces NO clasifiques como "Problemas que involucren el conjunto de los números enteros y racionales"
+        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
+        """
+
+PROMPT_ALG_Y_FUN = """
+        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
+        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
+
+        Rol:
+        Eres un experto en educación matemática escolar y evaluación PAES. A partir de IMÁGENES de preguntas PAES M1 (Unidad: Álgebra y Funciones), tu tarea es identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
+
+        Hay 6 grandes grupos: expresiones algebraicas, proporcionalidad, ecuaciones e inecuaciones de primer grado, sistemas de ecuaciones lineales, función lineal y afín, función cuadrática. Utilizando estos como referencia, clasifica según sub-unidad. 
+
+        Criterios de clasificación (usar exactamente estos nombres):
+        
+        Sub-unidades de expresiones algebraicas:
+        - "Productos notables"
+        - "Factorizaciones y desarrollo de expresiones algebraicas"
+        - "Operatoria con expresiones algebraicas"
+        - "Problemas que involucren expresiones algebraicas"
+
+        Sub-unidades de proporcionalidad:
+        - "Concepto de proporción directa e inversa"
+        - "Problemas que involucren proporción directa en inversa"
+
+        Sub-unidades de ecuaciones e inecuaciones de primer grado:
+        - "Resolución de ecuaciones lineales"
+        - "Problemas que involucren ecuaciones lineales"
+        - "Resolución de inecuaciones lineales"
+        - "Problemas que involucren inecuaciones lineales"
+
+        Sub-unidades de sistemas de ecuaciones lineales:
+        - "Resolución de sistemas de ecuaciones lineales"
+        - "Problemas que involucren sistemas de ecuaciones lineales"
+
+        Sub-unidades de función lineal y afín:
+        - "Concepto de función lineal y función afín"
+        - "Tablas y gráficos de función lineal y función afín"
+        - "Problemas que involucren función lineal y función afín"
+
+        Sub-unidades de función cuadrática:
+        - "Ecuaciones de segundo grado"
+        - "Tablas y gráficos de la función cuadrática"
+        - "Vértice, ceros de la función e intersección con los ejes, de la función cuadrática"
+        - "Función cuadrática"
+
+        Instrucciones estrictas:
+        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
+        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
+        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
+        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
+        """
+
+PROMPT_GEOM = """
+        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
+        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
+
+        Rol:
+        Eres un experto en educación matemática escolar y evaluación PAES. A partir de IMÁGENES de preguntas PAES M1 (Unidad: Geometría), tu tarea es identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
+
+        Criterios de clasificación (usar exactamente estos nombres):
+        
+        Hay 3 grandes grupos: figuras geométricas, cuerpos geométricos y transformaciones isométricas. Utilizando estos como referencia, clasifica según sub-unidad. 
+
+        Sub-unidades de figuras geométricas:
+        - "Problemas que involucren el Teorema de Pitágoras en diversos contextos"
+        - "Perímetro y áreas de triángulos, paralelogramos, trapecios y círculos"
+        - "Problemas que involucren perímetro y áreas de triángulos, paralelogramos, trapecios y círculos en diversos contextos"
+
+        Sub-unidades de cuerpos geométricos:
+        - "Área de superficies de paralelepípedos y cubos"
+        - "Volumen de paralelepípedos y cubos"
+        - "Problemas que involucren área y volumen de paralelepípedos y cubos en diversos contextos"
+
+        Sub-unidades de transformaciones isométricas:
+        - "Puntos y vectores en el plano cartesiano"
+        - "Rotación, traslación y reflexión de figuras geométricas"
+        - "Problemas que involucren rotación, traslación y reflexión en diversos contextos"
+        
+        Instrucciones estrictas:
+        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
+        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
+        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
+        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
+        """
+
+PROMPT_PROB_Y_EST = """
+        Devuelves EXCLUSIVAMENTE un JSON VÁLIDO con la estructura:
+        {"<id_pregunta>": {"Sub-unidad": ["<sub-unidad1>", "<sub-unidad2>", ...]}, ...}
+
+        Rol:
+        Eres un experto en educación matemática escolar y evaluación PAES. A partir de IMÁGENES de preguntas PAES M1 (Unidad: Probabilidad y estadística), tu tarea es identificar TODAS las sub-unidades temáticas explícitas o implícitas presentes en cada pregunta.
+
+        Criterios de clasificación (usar exactamente estos nombres):
+        
+        Hay 3 grandes grupos: representación de datos a través de tablas y gráficos, medidas de posición, reglas de las probabilidades. Utilizando estos como referencia, clasifica según sub-unidad. 
+
+        Sub-unidades de representación de datos a través de tablas y gráficos:
+        - "Tablas de frecuencia absoluta y relativa" 
+        - "Tipos de gráficos que permitan representar datos"
+        - "Promedio de un conjunto de datos"
+        - "Problemas que involucren tablas y gráficos en diversos contextos"
+
+        Sub-unidades de medidas de posición: 
+        - "Cuartiles y percentiles de uno o más grupos de datos" 
+        - "Diagrama de cajón para representar distribución de datos"
+        - "Problemas que involucren medidas de posición en diversos contextos"
+
+        Sub-unidades de reglas de las probabilidades:
+        - "Problemas que involucren probabilidad de un evento en diversos contextos" 
+        - "Problemas que involucren la regla aditiva y multiplicativa de probabilidades en diversos contextos"
+        
+        Instrucciones estrictas:
+        - Analiza CADA pregunta por separado y clasifícala según TODAS las sub-unidades que se evidencian.
+        - Elige TODAS las sub-unidades que aplique(n) por pregunta.
+        - Usa SOLO los nombres de sub-unidad exactamente como están escritos arriba.
+        - El resultado debe ser un JSON válido SIN texto adicional, comentarios ni explicaciones.
+        """
+
+# -------------------- Textos de usuario --------------------
+
+INPUT_TEXT_HABILIDADES = (
+    "Clasifica las habilidades utilizadas en cada pregunta y devuelve SOLO el JSON pedido. "
+    "Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
+)
+INPUT_TEXT_MATERIA = (
+    "Clasifica las materias utilizadas en cada pregunta y devuelve SOLO el JSON pedido. "
+    "Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
+)
+INPUT_TEXT_LATEX = (
+    "Redacta en formato LaTeX cada pregunta y devuelve SOLO el JSON pedido. "
+    "Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
+)
+INPUT_TEXT_SUB_UNIDAD = "Clasifica las sub-unidades utilizadas en cada pregunta y devuelve SOLO el JSON pedido. Cada bloque 'PREGUNTA_<id>' tiene su imagen asociada."
+
+
+# -------------------- Registro --------------------
+
+STAGES: list[Stage] = [
+    Stage(
+        name="habilidades",
+        prompt=PROMPT_HABILIDADES,
+        input_text=INPUT_TEXT_HABILIDADES,
+        output_keys=("Habilidades",),
+        labels=("Resolver Problemas", "Modelar", "Representar", "Argumentar"),
+    ),
+    Stage(
+        name="materia",
+        prompt=PROMPT_MATERIA,
+        input_text=INPUT_TEXT_MATERIA,
+        output_keys=("Unidad Temática",),
+        labels=("Números", "Álgebra y Funciones", "Geometría", "Probabilidad y Estadística"),
+    ),
+    Stage(
+        name="latex",
+        prompt=PROMPT_LATEX,
+        input_text=INPUT_TEXT_LATEX,
+        output_keys=("Enunciado", "Alternativas"),
+        enabled=False,
+    ),
+    Stage(
+        name="sub_num",
+        prompt=PROMPT_NUM,
+        input_text=INPUT_TEXT_SUB_UNIDAD,
+        output_keys=("Sub-unidad",),
+        labels=(
+            "Concepto y cálculo de porcentaje",
+            "Problemas que involucren porcentaje",
+            "Propiedades de las potencias de base racional y exponente racional",
+            "Descomposición y propiedades de las raíces enésimas en los números reales",
+            "Problemas que involucren potencias y raíces enésimas en los números reales",
+            "Operaciones y orden en el conjunto de los números enteros",
+            "Operaciones y comparación entre números en el conjunto de los números racionales",
+            "Problemas que involucren el conjunto de los números enteros y racionales",
+        ),
+        depends_on="materia",
+        depends_label="Números",
+    ),
+    Stage(
+        name="sub_alg_y_fun",
+        prompt=PROMPT_ALG_Y_FUN,
+        input_text=INPUT_TEXT_SUB_UNIDAD,
+        output_keys=("Sub-unidad",),
+        labels=(
+            "Productos notables",
+            "Factorizaciones y desarrollo de expresiones algebraicas",
+            "Operatoria con expresiones algebraicas",
+            "Problemas que involucren expresiones algebraicas",
+            "Concepto de proporción directa e inversa",
+            "Problemas que involucren proporción directa en inversa",
+            "Resolución de ecuaciones lineales",
+            "Problemas que involucren ecuaciones lineales",
+            "Resolución de inecuaciones lineales",
+            "Problemas que involucren inecuaciones lineales",
+            "Resolución de sistemas de ecuaciones lineales",
+            "Problemas que involucren sistemas de ecuaciones lineales",
+            "Concepto de función lineal y función afín",
+            "Tablas y gráficos de función lineal y función afín",
+            "Problemas que involucren función lineal y función afín",
+            "Ecuaciones de segundo grado",
+            "Tablas y gráficos de la función cuadrática",
+            "Vértice, ceros de la función e intersección con los ejes, de la función cuadrática",
+            "Función cuadrática",
+        ),
+        depends_on="materia",
+        depends_label="Álgebra y Funciones",
+    ),
+    Stage(
+        name="sub_geom",
+        prompt=PROMPT_GEOM,
+        input_text=INPUT_TEXT_SUB_UNIDAD,
+        output_keys=("Sub-unidad",),
+        labels=(
+            "Problemas que involucren el Teorema de Pitágoras en diversos contextos",
+            "Perímetro y áreas de triángulos, paralelogramos, trapecios y círculos",
+            "Problemas que involucren perímetro y áreas de triángulos, paralelogramos, trapecios y círculos en diversos contextos",
+            "Área de superficies de paralelepípedos y cubos",
+            "Volumen de paralelepípedos y cubos",
+            "Problemas que involucren área y volumen de paralelepípedos y cubos en diversos contextos",
+            "Puntos y vectores en el plano cartesiano",
+            "Rotación, traslación y reflexión de figuras geométricas",
+            "Problemas que involucren rotación, traslación y reflexión en diversos contextos",
+        ),
+        depends_on="materia",
+        depends_label="Geometría",
+    ),
+    Stage(
+        name="sub_prob_y_est",
+        prompt=PROMPT_PROB_Y_EST,
+        input_text=INPUT_TEXT_SUB_UNIDAD,
+        output_keys=("Sub-unidad",),
+        labels=(
+            "Tablas de frecuencia absoluta y relativa",
+            "Tipos de gráficos que permitan representar datos",
+            "Promedio de un conjunto de datos",
+            "Problemas que involucren tablas y gráficos en diversos contextos",
+            "Cuartiles y percentiles de uno o más grupos de datos",
+            "Diagrama de cajón para representar distribución de datos",
+            "Problemas que involucren medidas de posición en diversos contextos",
+            "Problemas que involucren probabilidad de un evento en diversos contextos",
+            "Problemas que involucren la regla aditiva y multiplicativa de probabilidades en diversos contextos",
+        ),
+        depends_on="materia",
+        depends_label="Probabilidad y Estadística",
+    ),
+]
+
+STAGES_BY_NAME: dict[str, Stage] = {s.name: s for s in STAGES}
+
+
+def get_stages(enabled_only: bool = True) -> list[Stage]:
+    """Etapas en orden de ejecución (las dependencias siempre van antes que sus dependientes)."""
+    return [s for s in STAGES if s.enabled or not enabled_only]
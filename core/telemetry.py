@@ -0,0 +1,228 @@
+import json
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+# USD por 1M de tokens: (input, input cacheado, output). Ajustar si cambian los precios.
+MODEL_PRICES = {
+    "gpt-5":      (1.25, 0.125, 10.00),
+    "gpt-5-mini": (0.25, 0.025,  2.00),
+    "gpt-5-nano": (0.05, 0.005,  0.40),
+}
+
+# Tokens de salida supuestos para una llamada antes de tener historial (incluye razonamiento)
+DEFAULT_OUTPUT_TOKENS_EST = 2000
+
+# Campos numéricos que se suman al agregar llamadas
+_SUM_FIELDS = ("calls", "input_tokens", "cached_tokens", "image_tokens_est", "output_tokens",
+               "reasoning_tokens", "total_tokens", "images", "retries", "errors", "latency_s", "cost_usd")
+
+
+class BudgetExceeded(Exception):
+    """Se alcanzó el tope de costo o tokens configurado para la corrida."""
+
+
+@dataclass
+class Budget:
+    """
+    Topes de gasto por corrida de run_categorization.
+
+    - max_cost_usd / max_total_tokens: la corrida se detiene (BudgetExceeded) antes de una
+      llamada que, según su estimación, haría pasar el tope.
+    - on_exceed="downgrade": desde 'downgrade_at' (fracción del tope) las llamadas pasan a
+      'downgrade_model' en vez de seguir con el modelo configurado; el tope sigue siendo duro.
+    """
+    max_cost_usd: float | None = None
+    max_total_tokens: int | None = None
+    on_exceed: str = "stop"              # "stop" | "downgrade"
+    downgrade_model: str = "gpt-5-nano"
+    downgrade_at: float = 0.8
+
+
+def image_tokens_estimate(width: int, height: int) -> int:
+    """
+    Estimación de tokens de imagen (detail=high): se escala a caber en 2048x2048, luego el
+    lado corto a 768 px, y se cobran 85 + 170 por cada tile de 512x512. La API no reporta
+    los tokens de imagen por separado: este valor es sólo una referencia.
+    """
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    tiles = math.ceil(w / 512) * math.ceil(h / 512)
+    return 85 + 170 * tiles
+
+def usage_to_dict(usage) -> dict:
+    """Normaliza response.usage (Responses API) a un dict plano; tolera None y campos ausentes."""
+    if usage is None:
+        return {}
+    input_details = getattr(usage, "input_tokens_details", None)
+    output_details = getattr(usage, "output_tokens_details", None)
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cached_tokens": getattr(input_details, "cached_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "reasoning_tokens": getattr(output_details, "reasoning_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+    }
+
+def text_tokens_estimate(text: str) -> int:
+    """Estimación gruesa de tokens de texto (~4 caracteres por token)."""
+    return math.ceil(len(text) / 4)
+
+def estimate_cost(model: str, input_tokens: int, cached_tokens: int, output_tokens: int) -> float:
+    """Costo en USD según MODEL_PRICES (0 si el modelo no tiene precio registrado)."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    price_in, price_cached, price_out = prices
+    uncached = max(input_tokens - cached_tokens, 0)
+    return (uncached * price_in + cached_tokens * price_cached + output_tokens * price_out) / 1_000_000
+
+
+class UsageTracker:
+    """
+    Acumula el uso de tokens, latencia y reintentos de cada llamada a OpenAI.
+
+    Cada llamada se agrega (una línea JSON) a 'metrics_path' apenas termina, así un corte a
+    mitad de corrida no pierde lo ya gastado. summary() agrega por etapa, examen y modelo.
+    """
+
+    def __init__(self, metrics_path: str | Path | None = None, budget: Budget | None = None):
+        self.metrics_path = Path(metrics_path) if metrics_path else None
+        self.budget = budget or Budget()
+        self.exam: str | None = None
+        self.last_model: str | None = None  # modelo de la última llamada (puede ser el de downgrade)
+        self.calls: list[dict] = []
+        self._warned_models: set[str] = set()
+        self._warned_downgrade = False
+        if self.metrics_path:
+            self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # ---- Presupuesto ----
+
+    def spent(self) -> tuple[float, int]:
+        return (sum(c["cost_usd"] for c in self.calls), sum(c["total_tokens"] for c in self.calls))
+
+    def estimate_call(self, model: str, input_tokens_est: int) -> tuple[float, int]:
+        """(costo, tokens) esperados de una llamada: la entrada estimada más la salida promedio
+        de las llamadas anteriores con ese modelo (DEFAULT_OUTPUT_TOKENS_EST si no hay)."""
+        outputs = [c["output_tokens"] for c in self.calls if c["model"] == model and c["output_tokens"]]
+        output_est = round(sum(outputs) / len(outputs)) if outputs else DEFAULT_OUTPUT_TOKENS_EST
+        return estimate_cost(model, input_tokens_est, 0, output_est), input_tokens_est + output_est
+
+    def budget_used(self, model: str, input_tokens_est: int = 0) -> float:
+        """Fracción del tope más ajustado que quedaría usada después de la próxima llamada."""
+        b = self.budget
+        cost, tokens = self.spent()
+        est_cost, est_tokens = self.estimate_call(model, input_tokens_est)
+        fractions = []
+        if b.max_cost_usd is not None:
+            fractions.append((cost + est_cost) / b.max_cost_usd if b.max_cost_usd > 0 else math.inf)
+        if b.max_total_tokens is not None:
+            fractions.append((tokens + est_tokens) / b.max_total_tokens if b.max_total_tokens > 0 else math.inf)
+        return max(fractions, default=0.0)
+
+    def choose_model(self, model: str, input_tokens_est: int = 0) -> str:
+        """
+        Modelo a usar en la próxima llamada, con 'input_tokens_est' tokens de entrada (texto +
+        imágenes). Lanza BudgetExceeded si la llamada haría pasar un tope, también con el
+        modelo de downgrade.
+        """
+        b = self.budget
+        used = self.budget_used(model, input_tokens_est)
+        if b.on_exceed == "downgrade" and used >= b.downgrade_at and model != b.downgrade_model:
+            downgraded = self.budget_used(b.downgrade_model, input_tokens_est)
+            if downgraded >= 1.0:
+                self._raise_exceeded()
+            if not self._warned_downgrade:
+                print(f"[WARN] Con la próxima llamada se usaría el {used:.0%} del presupuesto: "
+                      f"{model} -> {b.downgrade_model} en adelante.")
+                self._warned_downgrade = True
+            return b.downgrade_model
+        if used >= 1.0:
+            self._raise_exceeded()
+        return model
+
+    def _raise_exceeded(self):
+        cost, tokens = self.spent()
+        raise BudgetExceeded(f"Presupuesto agotado: {cost:.4f} USD, {tokens} tokens gastados; "
+                             "la próxima llamada pasaría el tope.")
+
+    # ---- Registro ----
+
+    def record(self, *, stage: str | None, model: str, usage: dict, latency_s: float,
+               retries: int, images: int, image_tokens_est: int, ok: bool):
+        if model not in MODEL_PRICES and model not in self._warned_models:
+            print(f"[WARN] Modelo sin precio en MODEL_PRICES: {model} (costo contado como 0).")
+            self._warned_models.add(model)
+        call = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "exam": self.exam,
+            "stage": stage,
+            "model": model,
+            "calls": 1,
+            "input_tokens": usage.get("input_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "image_tokens_est": image_tokens_est,
+            "output_tokens": usage.get("output_tokens", 0),
+            "reasoning_tokens": usage.get("reasoning_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "images": images,
+            "retries": retries,
+            "errors": 0 if ok else 1,
+            "latency_s": round(latency_s, 3),
+        }
+        self.last_model = model
+        call["cost_usd"] = estimate_cost(model, call["input_tokens"], call["cached_tokens"], call["output_tokens"])
+        self.calls.append(call)
+        if self.metrics_path:
+            with self.metrics_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(call, ensure_ascii=False) + "\n")
+
+    # ---- Resumen ----
+
+    def aggregate(self, key: str) -> dict:
+        """{valor de 'key': totales} para key en ('stage', 'exam', 'model')."""
+        out: dict = {}
+        for c in self.calls:
+            acc = out.setdefault(str(c[key]), dict.fromkeys(_SUM_FIELDS, 0))
+            for field in _SUM_FIELDS:
+                acc[field] += c[field]
+        return out
+
+    def summary(self) -> dict:
+        total = dict.fromkeys(_SUM_FIELDS, 0)
+        for c in self.calls:
+            for field in _SUM_FIELDS:
+                total[field] += c[field]
+        return {
+            "total": total,
+            "by_stage": self.aggregate("stage"),
+            "by_exam": self.aggregate("exam"),
+            "by_model": self.aggregate("model"),
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        header = f"{'':<28}{'llamadas':>9}{'input':>10}{'img~':>9}{'output':>9}{'reint.':>7}{'lat. s':>9}{'USD':>9}"
+
+        def line(name, t):
+            return (f"{name[:28]:<28}{t['calls']:>9}{t['input_tokens']:>10}{t['image_tokens_est']:>9}"
+                    f"{t['output_tokens']:>9}{t['retries']:>7}{t['latency_s']:>9.1f}{t['cost_usd']:>9.4f}")
+
+        print("\n========== Uso de OpenAI ==========")
+        for title, key in (("Por etapa", "by_stage"), ("Por examen", "by_exam"), ("Por modelo", "by_model")):
+            print(f"--- {title} ---")
+            print(header)
+            for name, totals in sorted(summary[key].items()):
+                print(line(name, totals))
+        print("--- Total ---")
+        print(line("TOTAL", summary["total"]))
+
+    def save_summary(self, path: str | Path):
+        with Path(path).open("w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2, sort_keys=True)
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+STATE_FILE = "watch_state.json"
+
+# Estados posibles de un PDF en el archivo de estado
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+
+# -------------------- Estado persistente --------------------
+
+def load_state(state_path: Path) -> dict:
+    """Lee el estado del modo vigilancia; si no existe o está corrupto, parte vacío."""
+    if not state_path.exists():
+        return {"files": {}}
+    try:
+        with state_path.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[WARN] No se pudo leer el estado {state_path}: {e}. Se parte desde cero.")
+        return {"files": {}}
+    state.setdefault("files", {})
+    return state
+
+def save_state(state: dict, state_path: Path):
+    """Escritura atómica (tmp + replace): un corte a mitad de escritura no deja el estado corrupto."""
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_suffix(state_path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# -------------------- Escaneo de entradas --------------------
+
+def scan_pdfs(input_root: Path) -> dict:
+    """Devuelve {ruta_pdf: (size, mtime_ns)} para todos los PDFs bajo input_root (recursivo)."""
+    found = {}
+    for path in sorted(input_root.rglob("*")):
+        if not path.is_file() or path.suffix.lower() != ".pdf":
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue  # el archivo desapareció entre el listado y el stat
+        found[str(path)] = (st.st_size, st.st_mtime_ns)
+    return found
+
+def output_dir_for(pdf_path: Path, input_root: Path, output_root: Path) -> str:
+    """input/PAES/x.pdf -> output/PAES/ (con '/' final, como espera run_categorization)."""
+    rel_parent = pdf_path.parent.relative_to(input_root)
+    out_dir = output_root / rel_parent
+    return str(out_dir).rstrip("/\\") + "/"
+
+
+# -------------------- Trabajo por PDF (corre en un proceso aparte) --------------------
+
+def process_pdf(pdf_path: str, output_path: str, categorize: bool, overwrite: bool,
+                extract_kwargs: dict, budget=None) -> dict:
+    """Extrae las preguntas de un PDF y, opcionalmente, las categoriza.
+
+    Guarda el índice del documento en <output_path>/indice_<doc>.xlsx para que la
+    categorización pueda retomarse sin volver a extraer (con otro nombre que el índice
+    completo bbdd_PAES_<timestamp>.xlsx, que es el que toma 'cli.py categorize').
+
+    Si la categorización queda incompleta (error de la API, tope de presupuesto) lanza
+    RuntimeError: el PDF queda con estado 'error' y se reintenta al reiniciar.
+    """
+    # Imports pesados sólo dentro del proceso trabajador
+    from core.identificacion_preguntas_PAES import get_questions
+
+    pdf = Path(pdf_path)
+    df_questions = get_questions(str(pdf.parent) + "/", output_path,
+                                 pdf_files=[pdf.name], save_excel=False, **extract_kwargs)
+    if df_questions.empty:
+        return {"questions": 0, "index_path": None, "categorized": categorize}
+
+    index_path = os.path.join(output_path, f"indice_{pdf.stem}.xlsx")
+    df_questions.to_excel(index_path, index=False)
+
+    if categorize:
+        # openai/dotenv sólo hacen falta al categorizar (watch --no-categorize no los requiere)
+        from core.categorizacion_gpt import run_categorization
+
+        completed = run_categorization(df_questions, output_path, overwrite=overwrite, budget=budget)
+        if not all(completed.values()):
+            raise RuntimeError(f"Categorización incompleta de {pdf.name}; se reintentará.")
+
+    return {"questions": len(df_questions), "index_path": index_path, "categorized": categorize}
+
+
+# -------------------- Bucle principal --------------------
+
+def watch(input_root: str = "input/",
+          output_root: str = "output/",
+          *,
+          poll_seconds: float = 10.0,
+          max_workers: int = 2,
+          categorize: bool = True,
+          once: bool = False,
+          extract_kwargs: dict | None = None,
+          budget=None):
+    """
+    Vigila 'input_root' y procesa sólo los PDFs nuevos o modificados.
+
+    - Un PDF se encola cuando su (tamaño, mtime) se mantiene estable entre dos escaneos
+      (evita tomar archivos a medio copiar) y su sha256 difiere del último procesado.
+    - Como máximo 'max_workers' PDFs se procesan en paralelo; el resto espera en la cola.
+    - El estado se guarda en <output_root>/watch_state.json después de cada cambio: al
+      reiniciar, los PDFs que quedaron encolados, a medio procesar o con error se reintentan.
+      Con categorize=True también se encolan los 'done' procesados sin categorizar
+      (p.ej. con --no-categorize): el estado guarda 'categorized' por PDF.
+    - once=True hace un solo ciclo (escanear, procesar todo lo pendiente y salir).
+    - 'budget' (core.telemetry.Budget) se aplica a la categorización de cada PDF por
+      separado, en su proceso trabajador: no es un tope global de la vigilancia. Un PDF que
+      alcanza el tope queda con 'error' (categorización incompleta).
+    - Un error de lectura de un PDF (movido, borrado o aún bloqueado por la copia) sólo
+      posterga ese archivo al próximo escaneo; si un proceso trabajador muere (crash de
+      MuPDF, OOM), los PDFs en curso quedan con 'error' y el pool se vuelve a crear.
+    """
+    input_root_p = Path(input_root)
+    output_root_p = Path(output_root)
+    state_path = output_root_p / STATE_FILE
+    state = load_state(state_path)
+    files_state: dict = state["files"]
+    extract_kwargs = extract_kwargs or {}
+
+    queue: deque[str] = deque()
+    in_flight: dict = {}     # Future -> ruta
+    last_seen: dict = {}   # ruta -> (size, mtime_ns) del escaneo anterior
+    dirty: set[str] = set()  # PDFs modificados mientras se procesaban
+
+    # Reanudar lo que quedó pendiente en una ejecución anterior
+    def needs_processing(entry: dict) -> bool:
+        return entry.get("status") != STATUS_DONE or (categorize and not entry.get("categorized"))
+
+    for pdf_path, entry in sorted(files_state.items()):
+        if needs_processing(entry) and Path(pdf_path).exists():
+            entry["status"] = STATUS_QUEUED
+            queue.append(pdf_path)
+    if queue:
+        print(f"[INFO] Reanudando {len(queue)} PDF(s) pendientes de una ejecución anterior.")
+        save_state(state, state_path)
+
+    def enqueue_changes():
+        nonlocal last_seen
+        current = scan_pdfs(input_root_p)
+        changed = False
+        for pdf_path, stat_key in list(current.items()):
+            if last_seen.get(pdf_path) != stat_key and not once:
+                continue  # todavía no estable: esperar al próximo escaneo
+            entry = files_state.get(pdf_path)
+            if entry and [entry.get("size"), entry.get("mtime_ns")] == list(stat_key):
+                continue  # sin cambios desde la última vez
+            if pdf_path in queue:
+                continue
+            if pdf_path in in_flight.values():
+                dirty.add(pdf_path)
+                continue
+            try:
+                sha = file_sha256(Path(pdf_path))
+            except OSError as e:
+                # Movido/borrado entre el escaneo y el hash, o bloqueado (Windows): reintentar luego
+                print(f"[WARN] No se pudo leer {pdf_path}: {e}. Se reintenta en el próximo escaneo.")
+                current.pop(pdf_path, None)
+                continue
+            if entry and entry.get("sha256") == sha and not needs_processing(entry):
+                # Sólo cambió el mtime (p.ej. copiado de nuevo): actualizar y no reprocesar
+                entry["size"], entry["mtime_ns"] = stat_key
+                changed = True
+                continue
+            files_state[pdf_path] = {
+                "sha256": sha,
+                "size": stat_key[0],
+                "mtime_ns": stat_key[1],
+                "status": STATUS_QUEUED,
+                "previous_sha256": entry.get("sha256") if entry else None,
+                "updated": datetime.now().isoformat(timespec="seconds"),
+            }
+            queue.append(pdf_path)
+            changed = True
+            print(f"[INFO] Encolado: {pdf_path}")
+        last_seen = current
+        if changed:
+            save_state(state, state_path)
+
+    def submit_ready(executor):
+        while queue and len(in_flight) < max_workers:
+            pdf_path = queue.popleft()
+            entry = files_state[pdf_path]
+            out_dir = output_dir_for(Path(pdf_path), input_root_p, output_root_p)
+            # Un PDF ya procesado que cambió debe sobrescribir su categorización anterior
+            overwrite = bool(entry.get("previous_sha256"))
+            try:
+                fut = executor.submit(process_pdf, pdf_path, out_dir, categorize, overwrite,
+                                      extract_kwargs, budget)
+            except BrokenProcessPool:
+                queue.appendleft(pdf_path)  # no alcanzó a empezar: sigue en la cola
+                raise
+            in_flight[fut] = pdf_path
+            entry["status"] = STATUS_RUNNING
+            entry["updated"] = datetime.now().isoformat(timespec="seconds")
+            print(f"[INFO] Procesando: {pdf_path}")
+        save_state(state, state_path)
+
+    def collect_finished() -> bool:
+        """Registra los PDFs terminados; True si el pool quedó roto (un trabajador murió)."""
+        broken = False
+        for fut in [f for f in in_flight if f.done()]:
+            pdf_path = in_flight.pop(fut)
+            entry = files_state[pdf_path]
+            entry["updated"] = datetime.now().isoformat(timespec="seconds")
+            try:
+                result = fut.result()
+                entry.update(result)
+                entry["status"] = STATUS_DONE
+                entry.pop("error", None)
+                print(f"[OK] {pdf_path}: {result['questions']} preguntas.")
+            except BrokenProcessPool as e:
+                entry["status"] = STATUS_ERROR
+                entry["error"] = f"El proceso trabajador terminó abruptamente: {e}"
+                print(f"[ERROR] {pdf_path}: {entry['error']}")
+                broken = True
+            except Exception as e:
+                entry["status"] = STATUS_ERROR
+                entry["error"] = str(e)
+                print(f"[ERROR] {pdf_path}: {e}")
+            if pdf_path in dirty:
+                # Se modificó durante el proceso: forzar re-escaneo completo del archivo
+                dirty.discard(pdf_path)
+                entry["size"] = entry["mtime_ns"] = None
+            save_state(state, state_path)
+        return broken
+
+    # Import diferido: multiprocessing es caro y 'status' sólo necesita el estado
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    print(f"[INFO] Vigilando {input_root_p} -> {output_root_p} (workers={max_workers}).")
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        enqueue_changes()
+        while True:
+            broken = False
+            try:
+                submit_ready(executor)
+            except BrokenProcessPool:
+                broken = True
+            if once and not queue and not in_flight and not broken:
+                break
+            time.sleep(0.5 if in_flight else poll_seconds)
+            broken = collect_finished() or broken
+            if broken:
+                # Un trabajador murió: lo que quedaba en curso falla con BrokenProcessPool
+                while in_flight:
+                    time.sleep(0.1)
+                    collect_finished()
+                print("[WARN] Un proceso trabajador terminó abruptamente; se reinicia el pool.")
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+            if not once:
+                enqueue_changes()
+    except KeyboardInterrupt:
+        # Lo que estaba en curso queda 'running' en el estado y se retoma al reiniciar
+        print("[INFO] Vigilancia detenida por el usuario.")
+        for fut in in_flight:
+            fut.cancel()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -7,4 +7,6 @@ output_path= "output/PAES/"
 
 #df_questions = get_questions(input_path, output_path, padding_cm = -0.25 , left_ratio=0.143)
 df_questions = pd.read_excel("output/PAES/bbdd_PAES_20251022_230341.xlsx") 
-run_categorization(df_questions, output_path)
\ No newline at end of file
+run_categorization(df_questions, output_path)
+
+# Modo vigilancia (PDFs nuevos/modificados en input/): python cli.py watch
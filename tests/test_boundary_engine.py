@@ -0,0 +1,127 @@
+import numpy as np
+
+from core.boundary_engine import PageIndex, _longest_sequence_mask, detect_columns, parse_question_tokens
+
+PAGE_W, PAGE_H = 612.0, 792.0
+
+
+def make_index(lines, n_pages=1):
+    """
+    PageIndex sintético. 'lines' = [(page, y0, [(x0, x1, texto), ...]), ...]; cada tupla
+    es una línea de 12 pt de alto.
+    """
+    cols = {k: [] for k in ("page", "x0", "y0", "x1", "y1", "text", "line_id", "line_start")}
+    for line_no, (page, y0, words) in enumerate(lines):
+        for word_no, (x0, x1, text) in enumerate(words):
+            cols["page"].append(page)
+            cols["x0"].append(x0)
+            cols["x1"].append(x1)
+            cols["y0"].append(y0)
+            cols["y1"].append(y0 + 12.0)
+            cols["text"].append(text)
+            cols["line_id"].append(line_no)
+            cols["line_start"].append(word_no == 0)
+    text = np.asarray(cols["text"], dtype=str)
+    return PageIndex(
+        page=np.asarray(cols["page"], dtype=np.int64),
+        x0=np.asarray(cols["x0"], dtype=float), y0=np.asarray(cols["y0"], dtype=float),
+        x1=np.asarray(cols["x1"], dtype=float), y1=np.asarray(cols["y1"], dtype=float),
+        text=text,
+        line_id=np.asarray(cols["line_id"], dtype=np.int64),
+        line_start=np.asarray(cols["line_start"], dtype=bool),
+        number=parse_question_tokens(text),
+        page_w=np.full(n_pages, PAGE_W),
+        page_h=np.full(n_pages, PAGE_H),
+    )
+
+
+def full_body(index):
+    return np.ones(len(index.page), dtype=bool)
+
+
+# -------------------- detect_columns --------------------
+
+def test_two_column_page_is_split_in_the_gutter():
+    lines = []
+    for i in range(20):
+        y = 80.0 + 20 * i
+        lines.append((0, y, [(60.0, 150.0, "texto"), (155.0, 290.0, "columna")]))
+        lines.append((0, y, [(320.0, 420.0, "texto"), (425.0, 550.0, "derecha")]))
+    index = make_index(lines)
+
+    split = detect_columns(index, full_body(index))
+
+    assert 290.0 < split[0] < 320.0
+
+def test_single_column_page_with_short_right_text_is_not_split():
+    # Enunciado a todo el ancho (cruza el canal) y alternativas cortas a la izquierda,
+    # con un par de rótulos sueltos a la derecha: no son una segunda columna.
+    lines = [
+        (0, 80.0, [(60.0, 80.0, "12."), (90.0, 400.0, "Considera"), (405.0, 540.0, "números")]),
+        (0, 100.0, [(90.0, 250.0, "¿Cuál"), (255.0, 290.0, "es")]),
+        (0, 140.0, [(90.0, 110.0, "A)"), (120.0, 180.0, "10")]),
+        (0, 160.0, [(90.0, 110.0, "B)"), (120.0, 180.0, "12")]),
+        (0, 180.0, [(90.0, 110.0, "C)"), (120.0, 180.0, "12,5")]),
+        (0, 200.0, [(90.0, 110.0, "D)"), (120.0, 180.0, "16,5")]),
+        (0, 140.0, [(350.0, 420.0, "figura")]),
+        (0, 180.0, [(350.0, 420.0, "eje")]),
+    ]
+    index = make_index(lines)
+
+    split = detect_columns(index, full_body(index))
+
+    assert np.isinf(split[0])
+
+def test_columns_are_detected_per_page():
+    lines = []
+    for i in range(20):
+        y = 80.0 + 20 * i
+        lines.append((0, y, [(60.0, 540.0, "una sola columna")]))
+        lines.append((1, y, [(60.0, 290.0, "izquierda")]))
+        lines.append((1, y, [(320.0, 550.0, "derecha")]))
+    index = make_index(lines, n_pages=2)
+
+    split = detect_columns(index, full_body(index))
+
+    assert np.isinf(split[0])
+    assert 290.0 < split[1] < 320.0
+
+def test_empty_body_has_no_columns():
+    index = make_index([(0, 80.0, [(60.0, 290.0, "x")])])
+
+    split = detect_columns(index, np.zeros(1, dtype=bool))
+
+    assert np.isinf(split).all()
+
+
+# -------------------- _longest_sequence_mask --------------------
+
+def test_sequence_drops_instruction_list_and_table_values():
+    # Instrucciones 1-4, preguntas 1-6 y un valor de tabla (150) entre medio
+    numbers = np.array([1, 2, 3, 4, 1, 2, 150, 3, 4, 5, 6])
+
+    keep = _longest_sequence_mask(numbers)
+
+    assert numbers[keep].tolist() == [1, 2, 3, 4, 5, 6]
+    assert keep.tolist() == [False] * 4 + [True, True, False, True, True, True, True]
+
+def test_sequence_tolerates_missing_numbers_up_to_max_gap():
+    numbers = np.array([1, 2, 3, 6, 7])
+
+    assert numbers[_longest_sequence_mask(numbers, max_gap=3)].tolist() == [1, 2, 3, 6, 7]
+    assert numbers[_longest_sequence_mask(numbers, max_gap=2)].tolist() == [1, 2, 3]
+
+def test_sequence_ignores_out_of_order_numbers():
+    numbers = np.array([1, 2, 3, 50, 4, 5])
+
+    assert numbers[_longest_sequence_mask(numbers)].tolist() == [1, 2, 3, 4, 5]
+
+def test_sequence_prefers_questions_over_a_preceding_instruction_list():
+    # Instrucciones 1-2 empalman con la pregunta 3: empate en largo, gana el inicio más tardío
+    numbers = np.array([1, 2, 1, 2, 3, 4])
+
+    assert _longest_sequence_mask(numbers).tolist() == [False, False, True, True, True, True]
+
+def test_sequence_edge_cases():
+    assert _longest_sequence_mask(np.array([], dtype=np.int64)).tolist() == []
+    assert _longest_sequence_mask(np.array([7])).tolist() == [True]